@@ -6,5 +6,5 @@ set -eu
 SCRIPT_DIR=$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )
 cd $SCRIPT_DIR
 
-wget https://zenodo.org/records/14497769/files/ksp_fully.hdr
-wget https://zenodo.org/records/14497769/files/ksp_fully.cfl
\ No newline at end of file
+# resumable, checksummed download, skips files that are already verified
+exec python3 fetch.py "$@"
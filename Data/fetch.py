@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# Download of the k-space data from Zenodo.
+#
+# Large files are downloaded in byte-range chunks by several threads into
+# <file>.part; the finished chunks are listed in <file>.part.json, so an
+# interrupted download continues where it stopped. Servers without range
+# support are read in one stream. A finished file is checked against the
+# SHA-256 in manifest.sha256 or, for files without entry, against the MD5
+# that Zenodo publishes in the metadata of the record. It is then stamped as
+# verified (.<file>.verified with size, mtime and hashes), so later runs skip
+# it without reading it again or asking Zenodo. The manifest is never written
+# by the fetcher: a file that can be checked against neither is kept with a
+# warning (its hashes only in the untracked stamp), or rejected with --strict.
+#
+# Usage: python3 fetch.py [--mirror URL] [--record URL] [--workers N] [--strict] [file ...]
+# The mirror can also be set with DATA_MIRROR, e.g. a local HTTP server for tests,
+# and the record metadata with DATA_RECORD ('' to use the manifest only).
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import functools
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+MIRROR = 'https://zenodo.org/records/14497769/files'
+RECORD = 'https://zenodo.org/api/records/14497769'
+FILES = ['ksp_fully.hdr', 'ksp_fully.cfl']
+CHUNK = 32 * 1024**2
+
+
+def read_manifest(path):
+    """
+    SHA-256 of the files, from lines '<sha256>  <file>' ('#' starts a comment).
+    """
+    manifest = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    digest, name = line.split(maxsplit=1)
+                    manifest[name.lstrip('*')] = digest.lower()
+    return manifest
+
+
+@functools.lru_cache
+def published_checksums(record):
+    """
+    Checksums of the files of a Zenodo record, e.g. {'ksp_fully.cfl': 'md5:...'}, empty if unavailable.
+    """
+    if not record:
+        return {}
+    try:
+        with urllib.request.urlopen(record) as response:
+            files = json.load(response)['files']
+    except (OSError, ValueError, KeyError) as e:
+        print(f'Warning: no checksums from {record}: {e}')
+        return {}
+    return {f['key']: f['checksum'].lower() for f in files if 'checksum' in f}
+
+
+def digests(path):
+    """
+    SHA-256 and MD5 of a file, read once.
+    """
+    hashes = dict(sha256=hashlib.sha256(), md5=hashlib.md5())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            for h in hashes.values():
+                h.update(block)
+    return {name: h.hexdigest() for name, h in hashes.items()}
+
+
+def _matches(hashes, expected):
+    # expected checksum as '<algorithm>:<hex>'
+    algorithm, digest = expected.split(':', 1)
+    return hashes.get(algorithm) == digest
+
+
+def _stamp_path(path):
+    return os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.verified')
+
+
+def _stamp(path, hashes, verified):
+    st = os.stat(path)
+    return dict(size=st.st_size, mtime_ns=st.st_mtime_ns, verified=verified, **hashes)
+
+
+def _read_stamp(path):
+    # the stamp of path, None if not stamped or changed since
+    stamp = _stamp_path(path)
+    if not os.path.exists(path) or not os.path.exists(stamp):
+        return None
+    with open(stamp) as f:
+        saved = json.load(f)
+    hashes = {k: saved.get(k) for k in ('sha256', 'md5')}
+    return saved if saved == _stamp(path, hashes, saved.get('verified')) else None
+
+
+def verified_hash(path):
+    """
+    SHA-256 of path from its stamp, None if not stamped or changed since.
+    """
+    stamp = _read_stamp(path)
+    return stamp['sha256'] if stamp is not None else None
+
+
+def _write_stamp(path, hashes, verified):
+    with open(_stamp_path(path), 'w') as f:
+        json.dump(_stamp(path, hashes, verified), f)
+
+
+def _probe(url):
+    # size of the file and whether the server answers range requests
+    request = urllib.request.Request(url, headers={'Range': 'bytes=0-0'})
+    with urllib.request.urlopen(request) as response:
+        if response.status == 206:
+            return int(response.headers['Content-Range'].rsplit('/', 1)[1]), True
+        length = response.headers.get('Content-Length')
+        return (int(length) if length is not None else None), False
+
+
+def _copy(response, f):
+    for block in iter(lambda: response.read(1 << 20), b''):
+        f.write(block)
+
+
+def _download_stream(url, part):
+    with urllib.request.urlopen(url) as response, open(part, 'wb') as f:
+        _copy(response, f)
+
+
+def _download_ranges(url, part, size, workers, chunk):
+    state = part + '.json'
+    done = set()
+    if os.path.exists(part) and os.path.exists(state):
+        with open(state) as f:
+            saved = json.load(f)
+        if saved['url'] == url and saved['size'] == size and saved['chunk'] == chunk:
+            done = set(saved['done'])
+    if not done:
+        with open(part, 'wb') as f:
+            f.truncate(size)
+
+    todo = [i for i in range((size + chunk - 1) // chunk) if i not in done]
+    if done:
+        print(f'Resuming {os.path.basename(part)}: {len(done)} of {len(done) + len(todo)} chunks present')
+    lock = threading.Lock()
+
+    def fetch(i):
+        start, stop = i * chunk, min(size, (i + 1) * chunk) - 1
+        request = urllib.request.Request(url, headers={'Range': f'bytes={start}-{stop}'})
+        with urllib.request.urlopen(request) as response, open(part, 'r+b') as f:
+            if response.status != 206:
+                raise IOError(f'{url}: expected a partial response for bytes {start}-{stop}, got {response.status}')
+            f.seek(start)
+            _copy(response, f)
+            if f.tell() != stop + 1:
+                raise IOError(f'{url}: incomplete chunk {start}-{stop}')
+        with lock:
+            done.add(i)
+            with open(state + '.tmp', 'w') as f:
+                json.dump(dict(url=url, size=size, chunk=chunk, done=sorted(done)), f)
+            os.replace(state + '.tmp', state)
+
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(fetch, todo))
+    os.unlink(state)
+
+
+def _unverified(name, hashes, strict):
+    message = f'{name} has neither a manifest entry nor a published checksum (sha256 {hashes["sha256"]})'
+    if strict:
+        raise IOError(message)
+    print(f'Warning: {message}, not verified')
+
+
+def fetch(name, mirror=MIRROR, workers=4, chunk=CHUNK, data_dir=DATA_DIR, strict=False, record=RECORD):
+    """
+    Download a file unless it is present and verified.
+
+    Args:
+        name (str): File name, relative to the mirror and data_dir.
+        mirror (str): Base URL.
+        workers (int): Number of parallel range requests.
+        chunk (int): Size of the range requests in bytes.
+        data_dir (str): Target directory, with the manifest.sha256 of its files.
+        strict (bool): Fail for files that cannot be verified instead of warning.
+        record (str): URL of the Zenodo record metadata with the MD5 of the files
+            without manifest entry, None to use the manifest only.
+
+    Returns:
+        str: Path of the verified file (or of its chunked store, if it was converted).
+    """
+    manifest_path = os.path.join(data_dir, 'manifest.sha256')
+    path = os.path.join(data_dir, name)
+    manifest = read_manifest(manifest_path).get(name)
+
+    def expected():
+        # '<algorithm>:<hex>' to check against, the record is only asked if needed
+        if manifest is not None:
+            return 'sha256:' + manifest
+        return published_checksums(record).get(name)
+
+    store = os.path.splitext(path)[0] + '.h5'
+    if not os.path.exists(path) and os.path.exists(store):
+        print(f'{name} was converted to {os.path.basename(store)} (common/kspstore.py), not downloading it')
+        return store
+
+    if os.path.exists(path):
+        stamp = _read_stamp(path)
+        if stamp is not None and stamp['verified'] and (manifest is None or stamp['sha256'] == manifest):
+            print(f'{name} is present and verified')
+            return path
+        hashes = {k: stamp[k] for k in ('sha256', 'md5')} if stamp is not None else digests(path)
+        checksum = expected()
+        if checksum is None:
+            _write_stamp(path, hashes, None)
+            _unverified(name, hashes, strict)
+            return path
+        if _matches(hashes, checksum):
+            _write_stamp(path, hashes, checksum)
+            print(f'{name} is present, checksum verified')
+            return path
+        print(f'{name} does not match its checksum, downloading again')
+
+    url = f'{mirror.rstrip("/")}/{name}'
+    part = path + '.part'
+    size, ranges = _probe(url)
+    print(f'Downloading {url}' + (f' ({size / 1024**2:.1f} MiB)' if size is not None else ''))
+    if ranges and size > chunk:
+        _download_ranges(url, part, size, workers, chunk)
+    else:
+        _download_stream(url, part)
+    if size is not None and os.path.getsize(part) != size:
+        raise IOError(f'{url}: expected {size} bytes, got {os.path.getsize(part)}')
+
+    hashes = digests(part)
+    checksum = expected()
+    if checksum is not None and not _matches(hashes, checksum):
+        os.unlink(part)
+        algorithm = checksum.split(':', 1)[0]
+        raise IOError(f'{name}: checksum mismatch, expected {checksum}, got {algorithm}:{hashes[algorithm]}')
+    if checksum is None:
+        if strict:
+            os.unlink(part)
+        _unverified(name, hashes, strict)
+    os.replace(part, path)
+    _write_stamp(path, hashes, checksum)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download the k-space data.')
+    parser.add_argument('files', nargs='*', default=FILES, help=f'files to fetch (default: {" ".join(FILES)})')
+    parser.add_argument('--mirror', default=os.environ.get('DATA_MIRROR', MIRROR),
+                        help='base URL of the files (default: DATA_MIRROR or Zenodo)')
+    parser.add_argument('--record', default=os.environ.get('DATA_RECORD', RECORD),
+                        help="Zenodo record metadata with the MD5 of the files (default: DATA_RECORD or Zenodo, "
+                             "'' for the manifest only)")
+    parser.add_argument('--workers', type=int, default=4, help='parallel range requests per file')
+    parser.add_argument('--strict', action='store_true', help='fail for files that cannot be verified')
+    args = parser.parse_args()
+
+    try:
+        for name in args.files:
+            fetch(name, args.mirror, args.workers, strict=args.strict, record=args.record or None)
+    except (IOError, OSError) as e:
+        sys.exit(f'Download failed: {e}')
@@ -0,0 +1,194 @@
+#Copyright 2024. TU Graz. Institute of Biomedical Imaging.
+#Author: Moritz Blumenthal
+#
+# Reconstructions of Figure 6 as a DAG of BART steps.
+# Steps are identified by their command and inputs; steps shared by several
+# variants (e.g. ESPIRiT calibration of ksp_cc, removal of the frequency
+# oversampling) run only once. The results written to out/ and those of the
+# expensive steps (ecalib, pics) are cached in cache/ and reused across runs,
+# the other intermediates (copies of the full k-space) are dropped after the
+# run. The cache is limited to FIG6_CACHE_MB (default 2048) MiB, least
+# recently used results are evicted first. Delete cache/ to recompute everything.
+#
+# Independent branches run concurrently; the number of concurrent BART jobs and
+# the total thread budget can be set with FIG6_JOBS and FIG6_THREADS.
+# FIG6_MASK=python replaces the Poisson-disc pattern of 'bart poisson' by the
+# seeded one of common/sampling.py (a different random pattern than the figure).
+# FIG6_WORKDIR=/dev/shm keeps the intermediate results in memory instead of
+# the temporary directory.
+#
+# With FIG6_SNAPSHOTS (e.g. "50,100,200,300") the PICS reconstructions of _iter
+# and _rec come from one chain of warm-started runs that yields a snapshot at
+# every listed iteration count. The chain restarts the momentum of the solver
+# at every snapshot, so its results differ slightly from single runs; the
+# default therefore keeps the separate runs used for the article.
+
+import os
+import sys
+import shutil
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(SCRIPT_DIR, '..', 'common'))
+from bartdag import Pipeline
+from cflio import write_cfl
+from sampling import poisson_disc
+from compose import compose
+
+DDIR = os.path.join(SCRIPT_DIR, '..', 'Data')
+ODIR = os.path.join(SCRIPT_DIR, 'out')
+os.makedirs(ODIR, exist_ok=True)
+
+if not os.path.exists(os.path.join(DDIR, 'ksp_fully.cfl')) and not os.path.exists(os.path.join(DDIR, 'ksp_fully.h5')):
+    raise RuntimeError("Data/ksp_fully.cfl not found, download it with Data/download.sh")
+
+p = Pipeline(os.path.join(SCRIPT_DIR, 'cache'), env={'BART_COMPAT_VERSION': 'v0.9.00'},
+             work_dir=os.environ.get('FIG6_WORKDIR'),
+             max_bytes=int(float(os.environ.get('FIG6_CACHE_MB', 2048)) * 1024**2))
+print(f'BART version: {p.version}')
+
+def out(name):
+    return os.path.join(ODIR, name)
+
+if os.path.exists(os.path.join(DDIR, 'ksp_fully.cfl')):
+    ksp_fully = p.source(os.path.join(DDIR, 'ksp_fully'))
+else:
+    # only the chunked store (common/kspstore.py) is present, exported for BART while the pipeline runs
+    ksp_fully = p.h5_source(os.path.join(DDIR, 'ksp_fully.h5'))
+
+# ## Generate Subsampling Pattern and Undersample k-Space
+
+if os.environ.get('FIG6_MASK') == 'python':
+    # same parameters as 'poisson -C24 -Y420 -y4 -Z24', first line in z
+    pat_file = os.path.join(p.cache_dir, 'pat_poisson_disc')
+    write_cfl(pat_file, poisson_disc((420, 24), accel=(4, 1), calib=(24, 24))[None, :, 0])
+    pat = p.source(pat_file)
+else:
+    pat = p.bart('slice 2 0', p.bart('poisson -C24 -Y420 -y4 -Z24'))
+p.png(p.bart('repmat 0 420', pat), out('pat'), '-x 1 -y 0')
+
+ksp_raw = p.bart('fmac', ksp_fully, pat)
+
+# ## Prewhiten k-Space Data
+# Noise is extracted from a region outside the FOV. The same noise from the undersampled k-space data is used to whiten the the fully sampled and the undersampled k-space data.
+
+noise = p.bart('transpose 1 0', p.bart('slice 0 50', p.bart('fft -i -u 1', ksp_raw)))
+
+ksp_white = p.bart('whiten -n', ksp_raw, noise)
+ksp_fully_white = p.bart('whiten -n', ksp_fully, noise)
+
+# ## Fully Sampled Reference Reconstruction
+
+col = p.bart('ecalib -m1', ksp_fully_white, keep=True)
+
+cim_os = p.bart('fft -i -u 3', ksp_fully_white)
+img = p.bart('flip 1', p.bart('fmac -C -s8', cim_os, col))
+img = p.bart('resize -c 0 320 1 320', img)
+rss = p.bart('rss 8', img)
+
+p.output(rss, out('rss'))
+p.png(rss, out('rss'), '-A -u800 -x1 -y0')
+
+
+def remove_oversampling(ksp):
+    # ## Remove Frequency Oversampling
+    return p.bart('fft -u 1', p.bart('resize -c 0 320', p.bart('fft -u -i 1', ksp)))
+
+def sensitivities(ksp, ecalib='ecalib -m1'):
+    # Estimate Coil Sensitivities
+    return p.bart('resize -c 0 320', p.bart(ecalib, ksp, keep=True))
+
+def reconstruct(ksp_nos, col, pics='pics -S -RW:3:0:0.001 -i300'):
+    # Perform PICS reconstruction
+    img = p.bart('flip 1', p.bart(pics, ksp_nos, col, keep=True))
+    # Take magnitude
+    rss = p.bart('rss 0', img)
+    # Remove phase oversampling
+    return p.bart('resize -c 0 320 1 320', rss)
+
+def reconstruct_snapshots(ksp_nos, col, iterations, pics='pics -S -RW:3:0:0.001'):
+    # PICS results after each number of iterations, every run continues from the previous snapshot
+    snapshots = {}
+    prev, done = None, 0
+    for n in sorted(set(iterations)):
+        options = {} if prev is None else {'-W': prev}
+        prev = p.bart(f'{pics} -i{n - done}', ksp_nos, col, options=options, keep=True)
+        done = n
+        snapshots[n] = p.bart('resize -c 0 320 1 320', p.bart('rss 0', p.bart('flip 1', prev)))
+    return snapshots
+
+def result(POST, rss, reference):
+    # Compute difference
+    diff = p.bart('rss 0', p.bart('saxpy -- -1', reference, rss))
+
+    p.output(rss, out('rss' + POST))
+    p.output(diff, out('diff' + POST))
+    p.png(rss, out('rss' + POST), '-A -u800 -x1 -y0')
+    p.png(diff, out('diff' + POST), '-A -u40  -x1 -y0')
+
+
+# ## Coil Compression to 12 Virtual Coils
+
+ksp_cc = p.bart('cc -p 12', ksp_white)
+ksp_nos = remove_oversampling(ksp_cc)
+
+# ## Reference Reconstruction of Undersampled k-Space Data
+
+snapshots = None
+if os.environ.get('FIG6_SNAPSHOTS'):
+    iterations = [int(n) for n in os.environ['FIG6_SNAPSHOTS'].split(',')]
+    snapshots = reconstruct_snapshots(ksp_nos, sensitivities(ksp_cc), iterations + [100, 300])
+
+rss_rec = reconstruct(ksp_nos, sensitivities(ksp_cc)) if snapshots is None else snapshots[300]
+result('_rec', rss_rec, rss)
+
+# ## Missing Information on Number of Iterations
+
+if snapshots is None:
+    result('_iter', reconstruct(ksp_nos, sensitivities(ksp_cc), 'pics -S -RW:3:0:0.001 -i100'), rss_rec)
+else:
+    result('_iter', snapshots[100], rss_rec)
+    # convergence study, not part of the figure
+    for n, rss_n in snapshots.items():
+        if n not in (100, 300):
+            result(f'_i{n}', rss_n, rss_rec)
+
+# ## Missing Information on Optimization Algorithm (not shown)
+
+result('_algo', reconstruct(ksp_nos, sensitivities(ksp_cc), 'pics -S -RW:3:0:0.001 -i300 -m'), rss_rec)
+
+# ## Missing Information on Number of Virtual Coils
+
+ksp_cc2 = p.bart('cc -p 8', ksp_white)
+result('_cc', reconstruct(remove_oversampling(ksp_cc2), sensitivities(ksp_cc2)), rss_rec)
+
+# ## Missing Information on ESPIRiT Parameter (Not shown)
+
+# WARNING: on Debian 12 the standard OpenBLAS library triggers a segfault in the SVD
+#          (c.f. https://github.com/OpenMathLib/OpenBLAS/issues/5000)
+#          As a workaround, the BLAS backend of BART can be changed with
+#          $ sudo update-alternatives --config libblas.so.3-x86_64-linux-gnu
+#          and selecting the slower reference BLAS implementation.
+
+result('_coils', reconstruct(ksp_nos, sensitivities(ksp_cc, 'ecalib -a -m1')), rss_rec)
+
+# ## Missing Information on Normalization of k-Space Data
+
+result('_normalize', reconstruct(ksp_nos, sensitivities(ksp_cc), 'pics -S -RW:3:0:0.001 -i300 -w1.'), rss_rec)
+
+# ## Missing Information on Prewhitening
+
+ksp_cc2 = p.bart('cc -p 12', ksp_raw)
+rss_white = reconstruct(remove_oversampling(ksp_cc2), sensitivities(ksp_cc2))
+
+p.call(lambda a, b: subprocess.run(['bart', 'nrmse', '-s', a, b], check=True, env=p.env), rss_white, rss_rec)
+result('_white', p.bart('scale 960703.75', rss_white), rss_rec)
+
+p.run(jobs=int(os.environ['FIG6_JOBS']) if 'FIG6_JOBS' in os.environ else None,
+      threads=int(os.environ['FIG6_THREADS']) if 'FIG6_THREADS' in os.environ else None)
+
+# # Generate Final Figure
+
+# the template links the images in out/
+shutil.copyfile(os.path.join(SCRIPT_DIR, 'Fig_6_template.svg'), out('Fig_6_reproducible_recon.svg'))
+compose(out('Fig_6_reproducible_recon.svg'), os.path.join(SCRIPT_DIR, 'Fig_6_reproducible_recon.pdf'))
@@ -2,59 +2,36 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.ndimage import binary_dilation, binary_erosion, binary_closing
-import cfl
-from bart import bart
 import os
 import sys
-import subprocess
 
-if 'BART_TOOLBOX_PATH' in os.environ and os.path.exists(os.environ['BART_TOOLBOX_PATH']):
-	sys.path.append(os.path.join(os.environ['BART_TOOLBOX_PATH'], 'python'))
-elif 'TOOLBOX_PATH' in os.environ and os.path.exists(os.environ['TOOLBOX_PATH']):
-	sys.path.append(os.path.join(os.environ['TOOLBOX_PATH'], 'python'))
-else:
-	raise RuntimeError("BART_TOOLBOX_PATH is not set correctly!")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from bartmem import BartSession
+from kspstore import read_slice
+import masks
+from metrics import mask_metrics, print_metrics
+from undersampling import sweep_masks, undersampled_rss
+from fftc import fftc, ifftc
+from coils import compress_coils
+from prewhiten import prewhiten
+from panels import write_panels
+from compose import compose
+import time
 
 
 # Utils
 # Mask generation function
+# Thresholding, closing of holes and dilation with square structures,
+# computed with separable filters (same result as scipy.ndimage, see common/masks.py)
 def create_brain_masks(mri_scan, loose_padding=5, hole_structre=5):
-    normalized_scan = (mri_scan - mri_scan.min()) / (mri_scan.max() - mri_scan.min()) # Normalize
-
-    # thresholding
-    tight_mask = normalized_scan > 0.1
-    # Fill holes in the tight mask using binary closing
-    structure = np.ones((hole_structre, hole_structre))
-    structure_erosion = np.ones((10, 10))
-
-    tight_mask = binary_closing(tight_mask, structure=structure)
-    tight_mask = binary_erosion(tight_mask, structure=structure_erosion)
-
-    # Create a wide mask by applying dilation to the tight mask
-    loose_mask = binary_dilation(tight_mask, structure=structure, iterations=loose_padding)
-    loose_mask = binary_erosion(loose_mask, structure=structure_erosion)
-
-    return tight_mask.astype(np.uint8), loose_mask.astype(np.uint8)
+    return masks.create_brain_masks(mri_scan, loose_padding=loose_padding, hole_structure=hole_structre)
 
+# Centered FFTs over the first two axes, multi-threaded (backend and threads: FFT_BACKEND, FFT_WORKERS)
 def ifft2c(kspace):
-    return np.fft.ifftshift(np.fft.ifft2(np.fft.fftshift(kspace, axes=(0, 1)), axes=(0, 1)), axes=(0, 1))
+    return ifftc(kspace, axes=(0, 1))
 
 def fft2c(image):
-    return np.fft.fftshift(np.fft.fft2(np.fft.ifftshift(image, axes=(0, 1)), axes=(0, 1)), axes=(0, 1))
-
-def calc_NRMSE(I_pred,I_true):
-        # Reshape the images into vectors
-        I_true = np.reshape(I_true,(1,-1))
-        I_pred = np.reshape(I_pred,(1,-1))
-        # Mean Square Error
-        MSE = np.square(np.subtract(I_true,I_pred)).mean()
-        # Root Mean Square Error
-        RMSE = np.sqrt(MSE)
-        # Normalized Root Mean Square Error
-        rr = np.max(I_true) - np.min(I_true) # range
-        NRMSE = RMSE/rr
-        return NRMSE
+    return fftc(image, axes=(0, 1))
 
 def crop_image_vertical(data, crop_fraction=0.2):
     """
@@ -82,36 +59,6 @@ def crop_image_horizontal(data, crop_fraction=0.2):
     crop_size = int(width * crop_fraction)
     return data[:,crop_size:width - crop_size, ...]
 
-def equispaced_mask(shape, factor, center_fraction=0.06):
-    """
-    Generate an equispaced undersampling mask.
-    
-    Args:
-        shape (tuple): Shape of the mask (height, width).
-        factor (int): Undersampling factor (controls acceleration).
-        center_fraction (float): Fraction of the center k-space to retain.
-
-    Returns:
-        np.ndarray: Equispaced undersampling mask.
-    """
-    height, width = shape  # Assuming shape is (height, width)
-    # Calculate the number of center lines to retain
-    num_center_lines = int(factor* center_fraction * width)
-    # Initialize the mask with zeros
-    mask = np.zeros((height, width), dtype=np.float32)
-    
-    # Add equispaced lines
-    step = factor  # Step size for equispaced lines
-    for i in range(0, width, step):
-        mask[:, i] = 1  # Set all pixels in the line to 1
-    
-    # Add center lines (full sampling in the center)
-    center_start = (width // 2) - (num_center_lines // 2)
-    center_end = center_start + num_center_lines
-    mask[:, center_start:center_end] = 1
-    
-    return mask
-
 # %% [markdown]
 # # Read raw data
 
@@ -120,9 +67,8 @@ def equispaced_mask(shape, factor, center_fraction=0.06):
 # %%
 # local data
 odir = os.path.abspath(os.path.dirname(sys.argv[0]))
-ksp_all = cfl.readcfl(odir+'/../Data/ksp_fully')
-slice_ksp_r1 = ksp_all
-slice_ksp_r1 = slice_ksp_r1[:,:,0,:]
+# ksp_fully.h5 (chunked) or ksp_fully.cfl (memory-mapped), only the first slice is read
+slice_ksp_r1 = read_slice(odir+'/../Data/ksp_fully', 0)
 
 
 # %% [markdown]
@@ -131,8 +77,10 @@ slice_ksp_r1 = slice_ksp_r1[:,:,0,:]
 # %%
 shape = (640, 420)  # Example shape
 factor = 2 # Undersampling factor
-mask_np = equispaced_mask(shape, factor)
-undersampling_mask = np.repeat(np.expand_dims(mask_np, axis=2), 32, axis=2)
+# Further factors for the NRMSE vs. R curve (not shown in the figure), only with FIG7_R_SWEEP=1
+sweep_factors = [3, 4, 6, 8] if os.environ.get('FIG7_R_SWEEP') == '1' else []
+# 1-D equispaced masks along the phase encoding, R=1 is the fully-sampled reference
+pe_masks, pe_settings = sweep_masks(shape[1], [1, factor] + sweep_factors)
 
 # %% [markdown]
 # # Data processing
@@ -141,31 +89,57 @@ undersampling_mask = np.repeat(np.expand_dims(mask_np, axis=2), 32, axis=2)
 # Cuts of background
 slice_vertical = 0.26
 slice_horizontal = 0.2
-
-#Prewhiten
-scan = bart(1,'fft -i -u 1',slice_ksp_r1 )
-noise = bart(1,'transpose 1 0',scan)
-ksp_white = bart(1,'whiten -n',slice_ksp_r1, noise)
+# SVD coil compression before FFT and RSS, e.g. 12 (None keeps all 32 physical coils as in the figure).
+# FIG7_CC_REPORT=1 also computes the images of all coils to report the speedup and the NRMSE of the compression.
+virtual_coils = int(os.environ['FIG7_VIRTUAL_COILS']) if 'FIG7_VIRTUAL_COILS' in os.environ else None
+cc_report = virtual_coils is not None and os.environ.get('FIG7_CC_REPORT') == '1'
+
+#Prewhiten as 'bart whiten -n' with the noise from 'bart fft -i -u 1' (the transpose does not change the covariance).
+# The coils are in dimension 2 here, BART (and prewhiten) expect them in dimension 3 and treat them as samples.
+# The whitening matrix is computed from the noise before any output is written, so the noise buffer is reused.
+noise = ifftc(slice_ksp_r1, axes=0, norm='ortho')
+ksp_white = prewhiten(slice_ksp_r1, noise, out=noise)
+
+# Cross-check with BART
+if os.environ.get('FIG7_BART_WHITEN') == '1':
+    with BartSession() as bart:
+        scan = bart('fft -i -u 1',slice_ksp_r1 )
+        bart_noise = bart('transpose 1 0',scan)
+        bart_white = bart('whiten -n',slice_ksp_r1, bart_noise)
+    print(f'Prewhitening, max. relative deviation from BART: {np.abs(ksp_white - bart_white).max() / np.abs(bart_white).max():.2e}')
 
 slice_ksp_r1 = ksp_white  # the data is kspace
-slice_r1 = ifft2c(slice_ksp_r1)
-
-
-slice_rss_r1 = np.sqrt(np.sum(np.abs(slice_r1) ** 2, axis=-1)) # RSS of scan
-slice_rss_r1 = np.flipud(slice_rss_r1[:,:]) # Flipup
-slice_rss_r1_cropped = crop_image_vertical(slice_rss_r1, crop_fraction=slice_vertical)  # Crop the RSS
-slice_rss_r1_cropped = crop_image_horizontal(slice_rss_r1_cropped, crop_fraction=slice_horizontal)  # Crop the RSS
 
-# Generate accelerated data using the fully-sampled data
-slice_ksp_r2 = slice_ksp_r1 * undersampling_mask
-slice_r2 = ifft2c(slice_ksp_r2)
-slice_rss_r2 = np.sqrt(np.sum(np.abs(slice_r2) ** 2, axis=-1)) # RSS of scan
-slice_rss_r2 = np.flipud(slice_rss_r2[:,:]) # Flipup
-slice_rss_r2_cropped = crop_image_vertical(slice_rss_r2, crop_fraction=slice_vertical)  # Crop the RSS
-slice_rss_r2_cropped = crop_image_horizontal(slice_rss_r2_cropped, crop_fraction=slice_horizontal)  # Crop the RSS
-
-r2_image = slice_rss_r2_cropped
-r1_image = slice_rss_r1_cropped
+# RSS of the fully-sampled and all accelerated data in one batched pass, the masks are broadcast over readout and coils
+if virtual_coils is None or cc_report:
+    start = time.perf_counter()
+    slice_rss = undersampled_rss(slice_ksp_r1, pe_masks)
+    time_coils = time.perf_counter() - start
+
+if virtual_coils is not None:
+    # compression estimated from the central 24 phase encoding lines
+    start = time.perf_counter()
+    calib = (slice(None), slice(shape[1] // 2 - 12, shape[1] // 2 + 12))
+    slice_ksp_cc, energy = compress_coils(slice_ksp_r1, virtual_coils, calib=calib)
+    slice_rss_cc = undersampled_rss(slice_ksp_cc, pe_masks)
+    time_cc = time.perf_counter() - start
+    del slice_ksp_cc
+
+    print(f'Coil compression {slice_ksp_r1.shape[-1]} -> {virtual_coils}: {100 * energy:.2f}% energy retained')
+    if cc_report:
+        cc_nrmse = [np.sqrt(np.mean((cc - ref)**2)) / (ref.max() - ref.min()) for cc, ref in zip(slice_rss_cc, slice_rss)]
+        print(f'Coil compression speedup {time_coils / time_cc:.1f}x, NRMSE vs. all coils {max(cc_nrmse):.4f} (worst of all R)')
+    slice_rss = slice_rss_cc
+
+sweep_images = []
+for slice_rss_r in slice_rss:
+    slice_rss_r = np.flipud(slice_rss_r[:,:]) # Flipup
+    slice_rss_r_cropped = crop_image_vertical(slice_rss_r, crop_fraction=slice_vertical)  # Crop the RSS
+    slice_rss_r_cropped = crop_image_horizontal(slice_rss_r_cropped, crop_fraction=slice_horizontal)  # Crop the RSS
+    sweep_images.append(slice_rss_r_cropped)
+
+r1_image = sweep_images[0]
+r2_image = sweep_images[1]
 
 # %% [markdown]
 # # Metric scores calculation masks generation
@@ -184,10 +158,25 @@ no_mask[-3:-1,:] = 0
 # # Calculate NRMSE scores
 
 # %%
-# NRMSE calculation
-no_mask_nrmse = calc_NRMSE(r2_image,r1_image)
-wide_mask_nrmse = calc_NRMSE(r2_image*wide_mask,r1_image*wide_mask)
-tight_mask_nrmse = calc_NRMSE(r2_image*tight_mask,r1_image*tight_mask)
+# NRMSE calculation (same as the NRMSE of the masked images, all masks in one pass)
+scores = mask_metrics(r2_image, r1_image, np.stack([np.ones(r1_image.shape), wide_mask, tight_mask]),
+                      names=['no', 'loose', 'tight'])
+no_mask_nrmse, wide_mask_nrmse, tight_mask_nrmse = scores['nrmse']
+print_metrics(scores)
+
+# NRMSE vs. mask parameters (not shown in the figure): all masks in one batched metric pass
+if os.environ.get('FIG7_MASK_SWEEP') == '1':
+    sweep_paddings = list(range(1, 11))
+    sweep_thresholds = [0.05, 0.1, 0.15, 0.2]
+    sweep_stack, sweep_labels = masks.brain_mask_sweep(r1_image, sweep_paddings, sweep_thresholds, hole_structure=40)
+    sweep_scores = mask_metrics(r2_image, r1_image, sweep_stack,
+                                names=[f't={t} p={p}' if p else f't={t} tight' for t, p in sweep_labels])
+    print_metrics(sweep_scores)
+
+# NRMSE vs. acceleration factor (not shown in the figure)
+for (R, _), image in zip(pe_settings[2:], sweep_images[2:]):
+    sweep_scores = mask_metrics(image, r1_image, np.stack([np.ones(r1_image.shape), wide_mask, tight_mask]))
+    print(f'R={R}: NRMSE with no/loose/tight mask: ' + ' / '.join(f'{x:.3f}' for x in sweep_scores['nrmse']))
 
 print(f'NRMSE with no mask: {no_mask_nrmse:.3f}')
 print(f'NRMSE with loose mask: {wide_mask_nrmse:.3f}')
@@ -199,18 +188,9 @@ print(f'NRMSE with tight mask: {tight_mask_nrmse:.3f}')
 ## For Saving plot as the paper
 
 # Create plots of Fully-Sampled & Reconstruction
-plt.figure(figsize=(5, 8))
-plt.imshow(np.sqrt(r2_image), cmap='gray')
-plt.axis('off')
-# Save as PNG
-plt.savefig("plot_2.png", dpi=900, bbox_inches='tight', pad_inches=0)
-plt.close()
-
-plt.figure(figsize=(5, 5))
-plt.imshow(np.sqrt(r1_image), cmap='gray')
-plt.axis('off')
-plt.savefig("plot_1.png", dpi=900, bbox_inches='tight', pad_inches=0)
-plt.close()
+# (sqrt scaled gray images, written directly as PNG at about the size of the former 900 dpi rendering)
+write_panels([dict(path="plot_1.png", image=r1_image, scale='sqrt', upscale=11),
+              dict(path="plot_2.png", image=r2_image, scale='sqrt', upscale=11)])
 
 # Masks plots
 # Add text in the middle of the plot
@@ -245,7 +225,7 @@ plt.savefig("plot_5.png", dpi=900, bbox_inches='tight', pad_inches=0)
 plt.close()
 
 
-subprocess.run(["inkscape", "--export-filename=Fig_7_NRMSE_vs_mask.pdf", "Fig_7_template.svg"])
+compose("Fig_7_template.svg", "Fig_7_NRMSE_vs_mask.pdf")
 #
 
 
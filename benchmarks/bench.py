@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# Stage-level benchmarks of the figure pipelines.
+#
+# Every stage is timed on its own, for a grid of problem sizes: the sequence
+# construction and the MRzero simulation (Fig 3/4) over base_resolution, and
+# the FFT recon, prewhitening, brain-mask morphology, image metrics and panel
+# export (Fig 7) over image size and coil count. The recon stages use the first
+# slice of Data/ksp_fully (cropped to the image size) if it is present and
+# synthetic k-space otherwise; the simulation uses a synthetic phantom if the
+# brain phantom is not available. 'bart_recon' and 'figure_export' are skipped
+# without bart or inkscape. Stages whose dependencies are not installed are
+# skipped as well; the reason of skipped or failed stages is kept in the results.
+#
+# Results are written as JSON with the machine metadata. 'compare' matches
+# two result files by stage and parameters and flags stages whose median
+# time increased by more than a threshold.
+#
+# Usage: python3 benchmarks/bench.py run [--base-resolution 32 64] [--coils 8 32] [--image-size 256 640]
+#                                         [--stages ...] [--repeat 5] [--output results.json]
+#        python3 benchmarks/bench.py compare baseline.json results.json [--threshold 0.1]
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import platform
+import argparse
+import tempfile
+import itertools
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'common'))
+
+KSP_FULLY = os.path.join(ROOT, 'Data', 'ksp_fully')
+
+# scratch directory of the current run, see run()
+_tmp = None
+
+
+class Skip(Exception):
+    """
+    A stage cannot run here, e.g. a missing program or package.
+    """
+
+
+# Input data
+
+def synthetic_image(n, seed=0):
+    """
+    Smooth head-like test image of n x n pixels: an ellipse with a darker rim and some structure.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[-1:1:n * 1j, -1:1:n * 1j]
+    r = (x / 0.7)**2 + (y / 0.85)**2
+    image = (r < 1) * (0.6 + 0.4 * np.cos(6 * x) * np.sin(4 * y)) + (np.abs(r - 0.95) < 0.05) * 0.4
+    return (image + 0.01 * rng.standard_normal((n, n))).astype(np.float32)
+
+
+def synthetic_ksp(n, coils, seed=0):
+    """
+    Multi-coil k-space (n, n, coils) of synthetic_image with smooth coil sensitivities and noise.
+    """
+    rng = np.random.default_rng(seed)
+    image = synthetic_image(n, seed)
+    y, x = np.mgrid[-1:1:n * 1j, -1:1:n * 1j]
+    angles = 2 * np.pi * np.arange(coils) / coils
+    sens = np.exp(-((x[..., None] - np.cos(angles))**2 + (y[..., None] - np.sin(angles))**2)) * np.exp(1j * angles)
+    ksp = np.fft.fftshift(np.fft.fft2(np.fft.ifftshift(image[..., None] * sens, axes=(0, 1)), axes=(0, 1)), axes=(0, 1))
+    ksp += 0.05 * np.abs(ksp).mean() * (rng.standard_normal(ksp.shape) + 1j * rng.standard_normal(ksp.shape))
+    return ksp.astype(np.complex64)
+
+
+def load_ksp(n, coils):
+    """
+    Fig 7 k-space of size (n, n, coils): the center of the first slice of
+    Data/ksp_fully if it is present and large enough, synthetic otherwise.
+
+    Returns:
+        ksp (np.ndarray): complex64 k-space.
+        source (str): 'ksp_fully' or 'synthetic'.
+    """
+    from kspstore import read_slice
+    if os.path.exists(KSP_FULLY + '.cfl') or os.path.exists(KSP_FULLY + '.h5'):
+        data = read_slice(KSP_FULLY, 0)
+        x, y, c = data.shape
+        if n <= min(x, y) and coils <= c:
+            x0, y0 = (x - n) // 2, (y - n) // 2
+            return np.ascontiguousarray(data[x0:x0 + n, y0:y0 + n, :coils]), 'ksp_fully'
+    return synthetic_ksp(n, coils), 'synthetic'
+
+
+def _rss_image(ksp):
+    from fftc import ifftc
+    return np.sqrt(np.sum(np.abs(ifftc(ksp, axes=(0, 1)))**2, axis=-1))
+
+
+# Stages, each returns the function to time (setup excluded) and a description of its input
+
+def stage_sequence(base_resolution):
+    from tse import TSEParams, build_tse
+    p = TSEParams(base_resolution=base_resolution)
+    return (lambda: build_tse(p)), 'TSE'
+
+
+def stage_simulate(base_resolution):
+    import torch
+    import MRzeroCore as mr0
+    from tse import TSEParams, build_tse, fov
+    from sim import load_sim_data, simulate
+    from sweep import PHANTOM_FILE
+
+    seq, _ = build_tse(TSEParams(base_resolution=base_resolution))
+    seq_file = os.path.join(_tmp, f'tse_{base_resolution}.seq')
+    seq.write(seq_file)
+
+    phantom = os.path.join(ROOT, 'Fig4_TSE_2Dre-implementation', PHANTOM_FILE)
+    if os.path.exists(phantom):
+        sim_data, source = load_sim_data(phantom, (base_resolution, base_resolution)), 'brain phantom'
+    else:
+        shape = (base_resolution, base_resolution, 1)
+        pd = torch.from_numpy(synthetic_image(base_resolution).clip(0)[..., None])
+        obj_p = mr0.VoxelGridPhantom(
+            PD=pd, T1=torch.full(shape, 1.0), T2=torch.full(shape, 0.1), T2dash=torch.full(shape, 0.03),
+            D=torch.zeros(shape), B0=torch.zeros(shape), B1=torch.ones((1,) + shape, dtype=torch.complex64),
+            coil_sens=torch.ones((1,) + shape, dtype=torch.complex64), size=torch.tensor([fov, fov, 0.008]))
+        sim_data, source = obj_p.build(), 'synthetic phantom'
+    return (lambda: simulate(seq_file, sim_data)), source
+
+
+def stage_fft_recon(image_size, coils):
+    ksp, source = load_ksp(image_size, coils)
+    return (lambda: _rss_image(ksp)), source
+
+
+def stage_bart_recon(image_size, coils):
+    from bartmem import BartSession, _bart_binary
+    if shutil.which(_bart_binary()) is None:
+        raise Skip('bart not found')
+    ksp, source = load_ksp(image_size, coils)
+    # coils in dimension 3, as BART expects and rss 8 combines
+    ksp = ksp[:, :, None, :]
+
+    def recon():
+        with BartSession() as bart:
+            np.array(bart('rss 8', bart('fft -i -u 3', ksp)))
+
+    return recon, source
+
+
+def stage_prewhiten(image_size, coils):
+    from fftc import ifftc
+    from prewhiten import prewhiten
+    ksp, source = load_ksp(image_size, coils)
+    ksp = ksp[:, :, None, :]
+    # noise as in Fig 7: the whole k-space after the inverse FFT along the readout
+    noise = ifftc(ksp, axes=(0,), norm='ortho')
+    out = np.empty_like(ksp)
+    return (lambda: prewhiten(ksp, noise, out=out)), source
+
+
+def stage_masks(image_size):
+    from masks import create_brain_masks
+    image, source = _stage_image(image_size)
+    return (lambda: create_brain_masks(image, loose_padding=5, hole_structure=40)), source
+
+
+def stage_metrics(image_size):
+    from masks import create_brain_masks
+    from metrics import mask_metrics
+    image, source = _stage_image(image_size)
+    pred = image + 0.02 * image.max() * np.random.default_rng(1).standard_normal(image.shape)
+    tight, loose = create_brain_masks(image)
+    stack = np.stack([np.ones_like(tight), loose, tight])
+    return (lambda: mask_metrics(pred, image, stack)), source
+
+
+def stage_panel_export(image_size):
+    from panels import write_panels
+    image, source = _stage_image(image_size)
+    panels = [dict(path=os.path.join(_tmp, f'plot_{image_size}_{i}.png'), image=image, scale='sqrt', upscale=4)
+              for i in range(2)]
+    return (lambda: write_panels(panels)), source
+
+
+def stage_figure_export(image_size):
+    from panels import write_panel
+    from compose import export
+    if shutil.which('inkscape') is None:
+        raise Skip('inkscape not found')
+    image, source = _stage_image(image_size)
+    tmp = tempfile.mkdtemp(dir=_tmp)
+    write_panel(os.path.join(tmp, 'plot_1.png'), image)
+    template = os.path.join(tmp, 'template.svg')
+    with open(template, 'w') as f:
+        f.write('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                f'width="{image_size}" height="{image_size}"><image xlink:href="plot_1.png" '
+                f'width="{image_size}" height="{image_size}"/></svg>\n')
+    return (lambda: export([(template, os.path.join(tmp, 'figure.pdf'))], force=True)), source
+
+
+def _stage_image(image_size):
+    # RSS image of the 8 coil k-space as input of the image stages
+    ksp, source = load_ksp(image_size, 8)
+    return _rss_image(ksp), source
+
+
+STAGES = {
+    'sequence': (stage_sequence, ['base_resolution']),
+    'simulate_2d': (stage_simulate, ['base_resolution']),
+    'fft_recon': (stage_fft_recon, ['image_size', 'coils']),
+    'bart_recon': (stage_bart_recon, ['image_size', 'coils']),
+    'prewhiten': (stage_prewhiten, ['image_size', 'coils']),
+    'masks': (stage_masks, ['image_size']),
+    'metrics': (stage_metrics, ['image_size']),
+    'panel_export': (stage_panel_export, ['image_size']),
+    'figure_export': (stage_figure_export, ['image_size']),
+}
+
+
+# Running
+
+def machine_info():
+    """
+    Metadata of the machine and software the benchmarks ran on.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    cpu = platform.processor()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as f:
+            names = [l.split(':', 1)[1].strip() for l in f if l.startswith('model name')]
+        cpu = names[0] if names else cpu
+    return dict(
+        hostname=socket.gethostname(), platform=platform.platform(), cpu=cpu,
+        cpu_count=os.cpu_count(),
+        cpus_available=len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count(),
+        python=platform.python_version(), numpy=np.__version__, commit=commit,
+        env={k: os.environ[k] for k in ['OMP_NUM_THREADS', 'FFT_BACKEND', 'FFT_WORKERS', 'MR0_CPUS']
+             if k in os.environ})
+
+
+@contextmanager
+def _quiet():
+    # silence the output of the stages (pypulseq, MRzero and Inkscape), also of compiled code
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def time_stage(fn, repeat, warmup=1):
+    """
+    Wall-clock times of repeat calls of fn, after warmup calls.
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run(stages, sizes, repeat=5):
+    """
+    Run the benchmarks of stages for all combinations of their size parameters.
+
+    Args:
+        stages (list of str): Names of the stages, see STAGES.
+        sizes (dict): Values of 'base_resolution', 'coils' and 'image_size'.
+        repeat (int): Number of timed runs per case.
+
+    Returns:
+        list of dict: One result per stage and parameter combination.
+    """
+    global _tmp
+    _tmp = tempfile.mkdtemp(prefix='bench')
+    try:
+        return _run(stages, sizes, repeat)
+    finally:
+        shutil.rmtree(_tmp, ignore_errors=True)
+
+
+def _run(stages, sizes, repeat):
+    results = []
+    for name in stages:
+        setup, keys = STAGES[name]
+        for values in itertools.product(*[sizes[k] for k in keys]):
+            params = dict(zip(keys, values))
+            label = ' '.join(f'{k}={v}' for k, v in params.items())
+            result = dict(stage=name, params=params)
+            try:
+                with _quiet():
+                    fn, source = setup(**params)
+                    times = time_stage(fn, repeat)
+                result.update(data=source, times=times, median=float(np.median(times)), min=min(times))
+                print(f'{name:>14} {label:<30} {result["median"] * 1e3:10.2f} ms  ({source})', flush=True)
+            except (Skip, ImportError) as e:
+                result.update(skipped=str(e))
+                print(f'{name:>14} {label:<30} {"skipped":>13}  ({e})', flush=True)
+            except Exception as e:
+                # e.g. input data the stage cannot handle, the other stages still run
+                result.update(failed=f'{type(e).__name__}: {e}')
+                print(f'{name:>14} {label:<30} {"failed":>13}  ({result["failed"]})', flush=True)
+            results.append(result)
+    return results
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compare the median times of two result files.
+
+    Args:
+        baseline (dict): Stored baseline results.
+        current (dict): New results.
+        threshold (float): Relative slowdown that counts as regression.
+
+    Returns:
+        list of dict: Regressions, with 'stage', 'params', 'baseline', 'current' and 'ratio'.
+    """
+    def key(r):
+        return r['stage'], json.dumps(r['params'], sort_keys=True)
+
+    old = {key(r): r for r in baseline['results'] if 'median' in r}
+    for field in ['cpu', 'cpus_available']:
+        if baseline['machine'].get(field) != current['machine'].get(field):
+            print(f"Warning: {field} differs ({baseline['machine'].get(field)} vs. {current['machine'].get(field)}), "
+                  'times are not comparable')
+
+    regressions = []
+    print(f'{"stage":>14} {"parameters":<30} {"baseline":>10} {"current":>10} {"ratio":>6}')
+    for r in current['results']:
+        if 'median' not in r or key(r) not in old:
+            continue
+        base = old[key(r)]['median']
+        ratio = r['median'] / base
+        status = ''
+        if ratio > 1 + threshold:
+            status = 'REGRESSION'
+            regressions.append(dict(stage=r['stage'], params=r['params'], baseline=base, current=r['median'],
+                                    ratio=ratio))
+        elif ratio < 1 / (1 + threshold):
+            status = 'faster'
+        label = ' '.join(f'{k}={v}' for k, v in r['params'].items())
+        print(f'{r["stage"]:>14} {label:<30} {base * 1e3:8.2f}ms {r["median"] * 1e3:8.2f}ms {ratio:6.2f} {status}')
+
+    measured = {key(r) for r in current['results'] if 'median' in r}
+    for k in old:
+        if k not in measured:
+            print(f'Warning: {k[0]} {k[1]} has no current result')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stage-level benchmarks of the figure pipelines.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    r = sub.add_parser('run', help='run the benchmarks')
+    r.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    r.add_argument('--base-resolution', nargs='+', type=int, default=[32, 64])
+    r.add_argument('--coils', nargs='+', type=int, default=[8, 32])
+    r.add_argument('--image-size', nargs='+', type=int, default=[256, 512])
+    r.add_argument('--repeat', type=int, default=5)
+    r.add_argument('--output', help='result file (default: benchmarks/results/<date>.json)')
+    c = sub.add_parser('compare', help='compare results with a baseline, exit code 1 on regressions')
+    c.add_argument('baseline')
+    c.add_argument('current')
+    c.add_argument('--threshold', type=float, default=0.1, help='relative slowdown that counts as regression')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        sizes = dict(base_resolution=args.base_resolution, coils=args.coils, image_size=args.image_size)
+        date = datetime.now(timezone.utc)
+        results = run(args.stages, sizes, args.repeat)
+        output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                                             date.strftime('%Y%m%d-%H%M%S') + '.json')
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(dict(date=date.isoformat(), machine=machine_info(), repeat=args.repeat, results=results),
+                      f, indent=1)
+        print(f'Results written to {output}')
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        print(f'{len(regressions)} regression(s) above {args.threshold:.0%}')
+        sys.exit(1 if regressions else 0)
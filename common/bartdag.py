@@ -0,0 +1,357 @@
+# Memoized execution of BART command pipelines.
+#
+# A pipeline is a DAG of BART steps. Every step is identified by a hash of its
+# command line, the hashes of its inputs and the BART version. Identical steps
+# are therefore only added (and run) once. Steps run in a temporary work
+# directory; the results used by outputs and those of steps marked to keep
+# (expensive ones, e.g. calibration and reconstruction) are moved into a cache
+# directory, so they are not recomputed on the next run either. Intermediates
+# such as copies of the full data are dropped after the run. The cache is
+# bounded in size and evicts the least recently used results first.
+#
+# Independent steps are run concurrently. Each BART process gets a share of
+# the thread budget via OMP_NUM_THREADS, so that the concurrent processes do
+# not oversubscribe the cores. The shares are assigned when steps start: the
+# free threads are split among the steps that can start at that moment and
+# returned when a step finishes, so a step on the critical path that runs
+# alone (e.g. the whitening of the full data) gets all of them.
+#
+# With a work_dir on a RAM-backed file system (e.g. /dev/shm), intermediate
+# results never touch the disk: BART maps its CFL files into memory, so the
+# handoff between steps is a shared page-cache mapping.
+#
+# Inputs in the chunked HDF5 store (common/kspstore.py) are exported to a CFL
+# file by a step of the pipeline, since BART only reads CFL files. The export
+# is keyed by the content of the store and deleted after the run.
+
+import os
+import json
+import shlex
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+def _bart_version():
+    return subprocess.run(['bart', 'version'], capture_output=True, text=True, check=True).stdout.strip()
+
+
+class Node:
+    """
+    Result of a pipeline step, stored as <cache_dir>/<key>.{cfl,hdr}.
+    """
+
+    def __init__(self, pipeline, key, cmd, inputs, path=None, options=None, func=None, temporary=False, keep=False):
+        self.pipeline = pipeline
+        self.key = key
+        self.cmd = cmd
+        self.inputs = inputs
+        self.options = options or {}
+        # results of kept steps are cached even if no output uses them
+        self.keep = keep
+        # steps computed in Python call func(output name) instead of BART
+        self.func = func
+        # temporary results are deleted after the run
+        self.temporary = temporary
+        # sources point to their file, all other nodes live in the cache
+        self.path = path if path is not None else os.path.join(pipeline.cache_dir, key)
+
+    def __repr__(self):
+        return f'Node({self.cmd!r}, {self.key[:8]})'
+
+    def dependencies(self):
+        return list(self.options.values()) + self.inputs
+
+    def done(self):
+        return os.path.exists(self.path + '.hdr') and os.path.exists(self.path + '.cfl')
+
+
+class Pipeline:
+    """
+    DAG of BART steps with persistent memoization.
+
+    Steps are added with bart(), which returns a Node that can be used as
+    input of further steps. Nothing is computed until run(), which executes
+    only the steps needed for the registered outputs and not yet cached.
+
+    Args:
+        cache_dir (str): Directory for the results used by outputs and of kept steps.
+        env (dict): Additional environment variables for the BART processes.
+        work_dir (str): Parent of the temporary directory for intermediate results,
+            e.g. /dev/shm, defaults to the temporary directory.
+        max_bytes (int): Size limit of the cache, least recently used results are evicted.
+    """
+
+    def __init__(self, cache_dir, env=None, work_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.work_dir = work_dir
+        self.max_bytes = max_bytes
+        self.env = dict(os.environ, **(env or {}))
+        self.version = _bart_version()
+        self.nodes = {}
+        self.sinks = []
+
+    def _hash(self, *parts):
+        h = hashlib.sha256()
+        h.update(self.version.encode())
+        for part in parts:
+            h.update(b'\0' + part.encode())
+        return h.hexdigest()
+
+    def source(self, path):
+        """
+        Existing CFL file (name without extension) used as input.
+        """
+        path = os.path.abspath(path)
+        if not os.path.exists(path + '.cfl'):
+            raise FileNotFoundError(f'{path}.cfl does not exist')
+        key = self._hash('source', self._file_hash(path))
+        return self.nodes.setdefault(key, Node(self, key, f'source {path}', [], path))
+
+    def h5_source(self, h5_path):
+        """
+        HDF5 store (common/kspstore.py) used as input.
+
+        BART needs a CFL file, so the store is exported by a step of the
+        pipeline when a step that is not cached needs it, and the copy is
+        deleted after the run. The step is keyed by the content of the store.
+        """
+        from kspstore import export_cfl
+        h5_path = os.path.abspath(h5_path)
+        if not os.path.exists(h5_path):
+            raise FileNotFoundError(f'{h5_path} does not exist')
+        key = self._hash('h5 source', self._file_hash(h5_path, exts=('',)))
+        node = Node(self, key, f'export {h5_path}', [], func=lambda name: export_cfl(h5_path, name), temporary=True)
+        return self.nodes.setdefault(key, node)
+
+    def bart(self, cmd, *inputs, options=None, keep=False):
+        """
+        BART step 'bart <cmd> [<option> <file>...] <inputs...> <output>'.
+
+        Args:
+            cmd (str): BART command with its options, e.g. 'fft -i -u 1'.
+            inputs (Node): Input files, in the order of the command line.
+            options (dict): Options that take a file, e.g. {'-W': node} for a warm start.
+            keep (bool): Cache the result even if no output uses it, for expensive steps.
+
+        Returns:
+            Node: The output of the step. Adding an identical step again returns the same Node.
+        """
+        options = dict(options or {})
+        key = self._hash(cmd, *[f'{o} {n.key}' for o, n in options.items()], *[n.key for n in inputs])
+        node = self.nodes.setdefault(key, Node(self, key, cmd, list(inputs), options=options))
+        node.keep = node.keep or keep
+        return node
+
+    def output(self, node, path):
+        """
+        Copy a result to path (name without extension) when the pipeline runs.
+        """
+        def copy():
+            for ext in ['.hdr', '.cfl']:
+                shutil.copyfile(node.path + ext, path + ext)
+        self.sinks.append(([node], copy))
+
+    def png(self, node, path, opts=''):
+        """
+        Write a result as PNG with cfl2png when the pipeline runs.
+        """
+        def write():
+            subprocess.run(['cfl2png', *shlex.split(opts), node.path, path], check=True, env=self.env)
+        self.sinks.append(([node], write))
+
+    def call(self, func, *nodes):
+        """
+        Call func(*paths) with the file names of the nodes when the pipeline
+        runs, e.g. to print a metric.
+        """
+        self.sinks.append((list(nodes), lambda: func(*[n.path for n in nodes])))
+
+    def _file_hash(self, path, exts=('.hdr', '.cfl')):
+        # hashing multi-GB inputs is slow, so the hash is stored by size and modification time
+        index_file = os.path.join(self.cache_dir, 'sources.json')
+        index = {}
+        if os.path.exists(index_file):
+            with open(index_file) as f:
+                index = json.load(f)
+
+        stats = [os.stat(path + ext) for ext in exts]
+        stamp = [[s.st_size, s.st_mtime_ns] for s in stats]
+        entry = index.get(path)
+        if entry is not None and entry['stamp'] == stamp:
+            return entry['hash']
+
+        h = hashlib.sha256()
+        for ext in exts:
+            with open(path + ext, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 24), b''):
+                    h.update(chunk)
+
+        index[path] = dict(stamp=stamp, hash=h.hexdigest())
+        tmp = index_file + f'.{os.getpid()}'
+        with open(tmp, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, index_file)
+        return index[path]['hash']
+
+    def _required(self):
+        # all steps the sinks depend on, in dependency order; the inputs of cached steps are not needed
+        order = []
+        seen = set()
+
+        def visit(node):
+            if node.key in seen:
+                return
+            seen.add(node.key)
+            if not node.done():
+                for n in node.dependencies():
+                    visit(n)
+            order.append(node)
+
+        for nodes, _ in self.sinks:
+            for n in nodes:
+                visit(n)
+        return order
+
+    def _execute(self, node, omp_threads, work=None):
+        if work is not None:
+            node.path = os.path.join(work, node.key)
+        # write to a temporary name and rename, an interrupted step leaves no result behind
+        tmp = node.path + f'.tmp{os.getpid()}'
+        if node.func is not None:
+            print(node.cmd, flush=True)
+            node.func(tmp)
+        else:
+            options = [arg for o, n in node.options.items() for arg in (o, n.path)]
+            args = ['bart', *shlex.split(node.cmd), *options, *[n.path for n in node.inputs], tmp]
+            env = dict(self.env, OMP_NUM_THREADS=str(omp_threads))
+            print('bart', node.cmd, flush=True)
+            subprocess.run(args, check=True, env=env)
+        os.replace(tmp + '.cfl', node.path + '.cfl')
+        os.replace(tmp + '.hdr', node.path + '.hdr')
+
+    def run(self, jobs=None, threads=None):
+        """
+        Execute all steps needed for the outputs that are not cached yet, then the outputs.
+
+        A step starts as soon as all its inputs are available, so independent
+        branches run concurrently.
+
+        Args:
+            jobs (int): Maximum number of concurrent BART processes, defaults to min(8, threads).
+            threads (int): Total thread budget, defaults to the number of CPUs.
+                The free threads are split among the steps that can start, see _schedule.
+        """
+        if threads is None:
+            threads = os.cpu_count() or 1
+        if jobs is None:
+            jobs = min(8, threads)
+        jobs = max(1, min(jobs, threads))
+
+        required = self._required()
+        pending = [n for n in required if not n.done()]
+        sinks = list(self.sinks)
+        print(f'{len(required) - len(pending)} of {len(required)} steps cached, running {len(pending)} '
+              f'(up to {jobs} jobs, {threads} threads)')
+        # mark the cached results as recently used
+        for node in required:
+            if node.done() and os.path.dirname(node.path) == self.cache_dir:
+                os.utime(node.path + '.cfl')
+
+        work = None
+        if pending:
+            work = tempfile.mkdtemp(prefix='bartdag-', dir=self.work_dir)
+        try:
+            self._schedule(pending, sinks, jobs, threads, work)
+        finally:
+            if work is not None:
+                self._persist(work, set(n.key for nodes, _ in self.sinks for n in nodes))
+                shutil.rmtree(work, ignore_errors=True)
+            for node in self.nodes.values():
+                if node.temporary:
+                    for ext in ['.hdr', '.cfl']:
+                        if os.path.exists(node.path + ext):
+                            os.unlink(node.path + ext)
+            self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used results until the cache fits into max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.cfl'):
+                continue
+            paths = [os.path.join(self.cache_dir, name[:-4] + ext) for ext in ['.cfl', '.hdr']]
+            try:
+                stats = [os.stat(path) for path in paths]
+            except FileNotFoundError:
+                continue
+            entries.append((stats[0].st_mtime, sum(st.st_size for st in stats), paths))
+
+        total = sum(e[1] for e in entries)
+        for _, size, paths in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in paths:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def _persist(self, work, keys):
+        # move results used by outputs and of kept steps from the work directory into the cache
+        for node in self.nodes.values():
+            wanted = node.key in keys or node.keep
+            if not wanted or node.temporary or os.path.dirname(node.path) != work or not node.done():
+                continue
+            cached = os.path.join(self.cache_dir, node.key)
+            for ext in ['.hdr', '.cfl']:
+                shutil.copyfile(node.path + ext, cached + ext + '.tmp')
+            for ext in ['.cfl', '.hdr']:
+                os.replace(cached + ext + '.tmp', cached + ext)
+            node.path = cached
+
+    def _schedule(self, pending, sinks, jobs, threads, work):
+        waiting = set(n.key for n in pending)  # not finished yet
+        running = {}  # future -> (node or None for sinks, threads)
+        free = threads
+
+        with ThreadPoolExecutor(jobs) as pool:
+            while pending or sinks or running:
+                # split the free threads among the steps that can start now (at least one each)
+                steps = sum(1 for node, _ in running.values() if node is not None)
+                ready = [n for n in pending if not any(i.key in waiting for i in n.dependencies())]
+                ready = ready[:max(0, min(jobs - steps, free))]
+                for i, node in enumerate(ready):
+                    omp_threads = free // (len(ready) - i)
+                    free -= omp_threads
+                    pending.remove(node)
+                    running[pool.submit(self._execute, node, omp_threads, work)] = (node, omp_threads)
+
+                for sink in [s for s in sinks if not any(n.key in waiting for n in s[0])]:
+                    sinks.remove(sink)
+                    running[pool.submit(sink[1])] = (None, 0)
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, omp_threads = running.pop(future)
+                    free += omp_threads
+                    try:
+                        future.result()
+                    except BaseException:
+                        for f in running:
+                            f.cancel()
+                        raise
+                    if node is not None:
+                        waiting.discard(node.key)
@@ -0,0 +1,104 @@
+# Calling BART from python through a RAM-backed directory.
+#
+# The bart() function of the BART python bindings writes every input to a
+# temporary CFL file and reads the output back into a new array. A BartSession
+# keeps these files on a tmpfs (/dev/shm) instead, returns outputs as read-only
+# memory maps of their CFL file, and hands its outputs to the next call by file
+# name, without copying them. Arrays of the caller may have been changed in
+# place since an earlier call, so they are written again for every call.
+
+import os
+import shlex
+import shutil
+import tempfile
+import subprocess
+
+from cflio import read_cfl, write_cfl
+
+
+SHM_DIR = '/dev/shm'
+
+
+def _bart_binary():
+    for var in ['BART_TOOLBOX_PATH', 'TOOLBOX_PATH']:
+        if var in os.environ and os.path.exists(os.path.join(os.environ[var], 'bart')):
+            return os.path.join(os.environ[var], 'bart')
+    return 'bart'
+
+
+class BartSession:
+    """
+    Run BART commands on numpy arrays with the files kept in memory.
+
+    Args:
+        work_dir (str): Parent of the session directory, defaults to /dev/shm
+            if available, else the temporary directory.
+        env (dict): Additional environment variables for the BART processes.
+
+    Example:
+        with BartSession() as bart:
+            noise = bart('transpose 1 0', bart('fft -i -u 1', ksp))
+            ksp_white = bart('whiten -n', ksp, noise)
+    """
+
+    def __init__(self, work_dir=None, env=None):
+        if work_dir is None:
+            work_dir = SHM_DIR if os.path.isdir(SHM_DIR) else None
+        self.dir = tempfile.mkdtemp(prefix='bartmem-', dir=work_dir)
+        self.env = dict(os.environ, **(env or {}))
+        self.bart = _bart_binary()
+        # id(output) -> (output, file name) of the read-only outputs; holding the array keeps its id valid
+        self._outputs = {}
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Remove the session directory. Returned memory maps stay valid until they are deleted.
+        """
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self._outputs = {}
+
+    def _name(self):
+        self._count += 1
+        return os.path.join(self.dir, f'{self._count}')
+
+    def _file(self, array):
+        # file name of an output of the session, None for arrays that have to be written
+        if id(array) in self._outputs:
+            return self._outputs[id(array)][1]
+        return None
+
+    def __call__(self, cmd, *inputs):
+        """
+        Run 'bart <cmd> <inputs...> <output>'.
+
+        Args:
+            cmd (str): BART command with its options, e.g. 'fft -i -u 1'.
+            inputs (np.ndarray): Input arrays, in the order of the command line.
+
+        Returns:
+            np.memmap: Read-only output, mapped from the session directory.
+        """
+        names = [self._file(a) for a in inputs]
+        written = []
+        for i, array in enumerate(inputs):
+            if names[i] is None:
+                names[i] = self._name()
+                write_cfl(names[i], array)
+                written.append(names[i])
+        out = self._name()
+        try:
+            subprocess.run([self.bart, *shlex.split(cmd), *names, out], check=True, env=self.env)
+        finally:
+            for name in written:
+                for ext in ['.hdr', '.cfl']:
+                    os.unlink(name + ext)
+        output = read_cfl(out)
+        self._outputs[id(output)] = (output, out)
+        return output
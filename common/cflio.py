@@ -0,0 +1,101 @@
+# Memory-mapped reading and streamed writing of BART CFL files.
+#
+# A CFL file is a raw complex64 array in column-major order, its dimensions
+# are stored in the .hdr file. read_cfl maps the file instead of loading it,
+# so slicing the result (e.g. one slice or some coils) only reads the pages
+# that are accessed. write_cfl and CflWriter write an array block by block
+# along its last dimension, which is contiguous in the file, so large arrays
+# never have to be held (or converted) in memory as a whole.
+
+import numpy as np
+
+
+def read_hdr(name):
+    """
+    Dimensions of a CFL file (name without extension) as stored in its .hdr file.
+    """
+    with open(name + '.hdr') as f:
+        for line in f:
+            if line.startswith('# Dimensions'):
+                return [int(d) for d in f.readline().split()]
+    raise ValueError(f'{name}.hdr has no dimensions')
+
+
+def read_cfl(name, mode='r'):
+    """
+    Memory-map a CFL file.
+
+    Trailing singleton dimensions are dropped, as by cfl.readcfl.
+
+    Args:
+        name (str): File name without extension.
+        mode (str): np.memmap mode, 'r' (read-only), 'r+' (write through) or 'c' (copy-on-write).
+
+    Returns:
+        np.memmap: complex64 array, slices of it are lazy views into the file.
+    """
+    dims = read_hdr(name)
+    n = int(np.prod(dims))
+    dims = dims[:int(np.searchsorted(np.cumprod(dims), n)) + 1]
+    return np.memmap(name + '.cfl', dtype=np.complex64, mode=mode, shape=tuple(dims), order='F')
+
+
+def write_hdr(name, dims):
+    with open(name + '.hdr', 'w') as f:
+        f.write('# Dimensions\n' + ' '.join(str(d) for d in dims) + '\n')
+
+
+class CflWriter:
+    """
+    Write a CFL file block by block along the last dimension.
+
+    Args:
+        name (str): File name without extension.
+        dims (tuple): Dimensions of the whole array.
+
+    Example:
+        with CflWriter('ksp', (640, 420, nslices, 32)) as w:
+            for coil in range(32):
+                w.write(ksp_of_coil(coil)[..., None])
+    """
+
+    def __init__(self, name, dims):
+        self.name = name
+        self.dims = tuple(dims)
+        self.written = 0
+        write_hdr(name, self.dims)
+        self.file = open(name + '.cfl', 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(check=exc_type is None)
+
+    def write(self, block):
+        """
+        Append a block of shape dims[:-1] + (k,).
+        """
+        block = np.asarray(block)
+        if block.shape[:-1] != self.dims[:-1] or self.written + block.shape[-1] > self.dims[-1]:
+            raise ValueError(f'block of shape {block.shape} does not fit into {self.dims} at {self.written}')
+        block.astype(np.complex64).T.tofile(self.file)  # column-major order
+        self.written += block.shape[-1]
+
+    def close(self, check=True):
+        self.file.close()
+        if check and self.written != self.dims[-1]:
+            raise ValueError(f'{self.name}.cfl is incomplete, {self.written} of {self.dims[-1]} blocks written')
+
+
+def write_cfl(name, array, chunk_bytes=64 * 1024**2):
+    """
+    Write an array (e.g. a memory map or a view of one) as CFL file in chunks of about chunk_bytes.
+    """
+    array = np.asanyarray(array)
+    dims = array.shape if array.ndim > 0 else (1,)
+    array = array.reshape(dims)
+    step = max(1, chunk_bytes // max(1, 8 * int(np.prod(dims[:-1]))))
+    with CflWriter(name, dims) as w:
+        for i in range(0, dims[-1], step):
+            w.write(array[..., i:i + step])
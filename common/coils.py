@@ -0,0 +1,49 @@
+# SVD coil compression.
+#
+# The k-space samples of all coils form a matrix X (samples x coils). The
+# right singular vectors of X, i.e. the eigenvectors of the coil covariance
+# X^H X, define virtual coils ordered by energy; keeping the first ones
+# compresses the data with the least loss, as 'bart cc -S'. Only the small
+# coils x coils covariance is decomposed, never X itself.
+
+import numpy as np
+
+
+def compression_matrix(ksp, virtual_coils, coil_axis=-1, calib=None):
+    """
+    SVD coil compression matrix.
+
+    Args:
+        ksp (np.ndarray): k-space data with the coils along coil_axis.
+        virtual_coils (int): Number of virtual coils to keep.
+        coil_axis (int): Axis of the coils.
+        calib (tuple of slice): Optional region of ksp (indexing the other axes)
+            used to estimate the compression, e.g. the k-space center.
+
+    Returns:
+        matrix (np.ndarray): (coils, virtual_coils) matrix, ksp @ matrix along the coil axis compresses.
+        energy (float): Fraction of the signal energy retained.
+    """
+    data = np.moveaxis(np.asarray(ksp), coil_axis, -1)
+    if calib is not None:
+        data = data[calib]
+    X = data.reshape(-1, data.shape[-1])
+
+    cov = X.conj().T @ X
+    eigval, eigvec = np.linalg.eigh(cov)  # ascending
+    eigval, eigvec = eigval[::-1], eigvec[:, ::-1]
+    energy = eigval[:virtual_coils].sum() / eigval.sum()
+    return eigvec[:, :virtual_coils].astype(data.dtype), float(energy)
+
+
+def compress_coils(ksp, virtual_coils, coil_axis=-1, calib=None):
+    """
+    Compress ksp to virtual_coils virtual coils, see compression_matrix.
+
+    Returns:
+        ksp_cc (np.ndarray): Compressed k-space, virtual coils along coil_axis.
+        energy (float): Fraction of the signal energy retained.
+    """
+    matrix, energy = compression_matrix(ksp, virtual_coils, coil_axis, calib)
+    ksp_cc = np.moveaxis(np.asarray(ksp), coil_axis, -1) @ matrix
+    return np.moveaxis(ksp_cc, -1, coil_axis), energy
@@ -0,0 +1,139 @@
+# Composition of the final figures with Inkscape.
+#
+# A figure is an SVG template with linked PNG panels, exported to PDF. The
+# export is skipped if the template and all linked files are unchanged since
+# the last export (compared by content hash). Stale figures are exported
+# together in one 'inkscape --shell' session, so Inkscape starts only once.
+#
+# With COMPOSE_DEFER=1 the figure scripts only queue their figure; all queued
+# figures are then exported at once with 'python common/compose.py'.
+#
+# The hashes and the queue are kept in .compose/ in the repository root.
+
+import os
+import re
+import sys
+import json
+import hashlib
+import subprocess
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.compose')
+
+_HREF = re.compile(r'(?:xlink:|ns\d+:)?href="([^"#][^"]*)"')
+
+
+def _key(pdf):
+    return hashlib.sha256(os.path.abspath(pdf).encode()).hexdigest()[:16]
+
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + f'.{os.getpid()}'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+
+
+def linked_files(template):
+    """
+    Files linked by an SVG template (embedded data: images excluded), as absolute paths.
+    """
+    with open(template) as f:
+        hrefs = _HREF.findall(f.read())
+    base = os.path.dirname(os.path.abspath(template))
+    return sorted(set(os.path.normpath(os.path.join(base, h)) for h in hrefs if not h.startswith('data:')))
+
+
+def figure_hash(template):
+    """
+    Hash of a template and the content of all files it links.
+    """
+    h = hashlib.sha256(_file_hash(template).encode())
+    for path in linked_files(template):
+        h.update(b'\0' + os.path.basename(path).encode())
+        h.update(_file_hash(path).encode() if os.path.exists(path) else b'missing')
+    return h.hexdigest()
+
+
+def is_up_to_date(template, pdf):
+    state = os.path.join(STATE_DIR, _key(pdf) + '.state')
+    if not os.path.exists(pdf) or not os.path.exists(state):
+        return False
+    with open(state) as f:
+        return json.load(f)['hash'] == figure_hash(template)
+
+
+def export(figures, force=False):
+    """
+    Export figures whose template or linked files changed in one Inkscape session.
+
+    Args:
+        figures (list of tuple): (template, pdf) of every figure.
+        force (bool): Export all figures.
+
+    Returns:
+        list of str: PDFs that were exported.
+    """
+    figures = [(os.path.abspath(t), os.path.abspath(p)) for t, p in figures]
+    stale = [(t, p) for t, p in figures if force or not is_up_to_date(t, p)]
+    for t, p in figures:
+        if (t, p) not in stale:
+            print(f'{os.path.relpath(p)} is up to date')
+    if not stale:
+        return []
+
+    hashes = [figure_hash(t) for t, _ in stale]
+    mtimes = [os.path.getmtime(p) if os.path.exists(p) else None for _, p in stale]
+    commands = ''.join(f'file-open:{t}; export-filename:{p}; export-do; file-close\n' for t, p in stale)
+    print(f'Exporting {len(stale)} figure(s) with inkscape')
+    subprocess.run(['inkscape', '--shell'], input=commands + 'quit\n', text=True, check=True,
+                   stdout=subprocess.DEVNULL)
+
+    for (t, p), h, mtime in zip(stale, hashes, mtimes):
+        if not os.path.exists(p) or os.path.getmtime(p) == mtime:
+            raise RuntimeError(f'inkscape did not export {p}')
+        _write_json(os.path.join(STATE_DIR, _key(p) + '.state'), dict(template=t, pdf=p, hash=h))
+        print(f'Exported {os.path.relpath(p)}')
+    return [p for _, p in stale]
+
+
+def compose(template, pdf):
+    """
+    Export a figure, or queue it if COMPOSE_DEFER=1.
+    """
+    if os.environ.get('COMPOSE_DEFER') == '1':
+        _write_json(os.path.join(STATE_DIR, _key(pdf) + '.pending'),
+                    dict(template=os.path.abspath(template), pdf=os.path.abspath(pdf)))
+        print(f'Queued {os.path.relpath(pdf)} for composition')
+        return
+    export([(template, pdf)])
+
+
+def export_pending(force=False):
+    """
+    Export all queued figures in one Inkscape session.
+    """
+    if not os.path.isdir(STATE_DIR):
+        return []
+    pending = sorted(os.path.join(STATE_DIR, n) for n in os.listdir(STATE_DIR) if n.endswith('.pending'))
+    figures = []
+    for path in pending:
+        with open(path) as f:
+            entry = json.load(f)
+        figures.append((entry['template'], entry['pdf']))
+    exported = export(figures, force)
+    for path in pending:
+        os.unlink(path)
+    return exported
+
+
+if __name__ == '__main__':
+    export_pending(force='--force' in sys.argv[1:])
@@ -0,0 +1,119 @@
+# Centered FFTs with a selectable, multi-threaded backend.
+#
+# The centered FFT fftshift(fft(ifftshift(x))) needs two shifted copies of the
+# data. For an even length N it equals (-1)^(N/2) * c * fft(c * x) with the
+# alternating sign c[n] = (-1)^n, so the shifts become one modulation of a
+# copy of the input (which the transform then overwrites) and an in-place
+# modulation of the output. Odd lengths fall back to the shifts.
+#
+# Backends:
+#   'scipy'  scipy.fft with 'workers' threads (default)
+#   'numpy'  numpy.fft, single-threaded
+#   'pyfftw' pyFFTW with its plan cache, if installed
+# The default backend and number of threads can be set with set_backend() or
+# the FFT_BACKEND and FFT_WORKERS environment variables.
+
+import os
+from functools import lru_cache
+
+import numpy as np
+import scipy.fft
+
+
+_backend = os.environ.get('FFT_BACKEND', 'scipy')
+_workers = int(os.environ.get('FFT_WORKERS', os.cpu_count() or 1))
+
+
+def set_backend(backend=None, workers=None):
+    """
+    Set the default backend ('scipy', 'numpy' or 'pyfftw') and/or number of threads.
+    """
+    global _backend, _workers
+    if backend is not None:
+        if backend not in ('scipy', 'numpy', 'pyfftw'):
+            raise ValueError(f"Unknown FFT backend '{backend}', expected 'scipy', 'numpy' or 'pyfftw'")
+        _backend = backend
+    if workers is not None:
+        _workers = workers
+
+
+@lru_cache(maxsize=None)
+def _pyfftw():
+    try:
+        import pyfftw
+        import pyfftw.interfaces.numpy_fft
+    except ImportError:
+        raise ImportError("The 'pyfftw' FFT backend requires pyFFTW (pip install pyfftw)") from None
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60)
+    return pyfftw.interfaces.numpy_fft
+
+
+def _transform(x, axes, inverse, norm, backend, workers):
+    # x is a private copy and may be overwritten
+    if backend == 'scipy':
+        f = scipy.fft.ifftn if inverse else scipy.fft.fftn
+        return f(x, axes=axes, norm=norm, workers=workers, overwrite_x=True)
+    if backend == 'numpy':
+        f = np.fft.ifftn if inverse else np.fft.fftn
+        return f(x, axes=axes, norm=norm)
+    if backend == 'pyfftw':
+        fft = _pyfftw()
+        f = fft.ifftn if inverse else fft.fftn
+        return f(x, axes=axes, norm=norm, threads=workers, overwrite_input=True)
+    raise ValueError(f"Unknown FFT backend '{backend}'")
+
+
+@lru_cache(maxsize=64)
+def _modulation(sizes, axes, ndim, dtype):
+    # product of the alternating signs along the axes, broadcastable to the data
+    c = np.ones((1,) * ndim, dtype=dtype)
+    for n, a in zip(sizes, axes):
+        s = np.ones(n, dtype=dtype)
+        s[1::2] = -1
+        c = c * s.reshape([-1 if i == a else 1 for i in range(ndim)])
+    c.setflags(write=False)
+    return c
+
+
+def _centered(x, axes, inverse, norm, backend, workers):
+    x = np.asarray(x)
+    if not np.iscomplexobj(x):
+        x = x.astype(np.result_type(x.dtype, np.complex64))
+    axes = (axes,) if np.isscalar(axes) else tuple(axes)
+    axes = tuple(a % x.ndim for a in axes)
+    backend = _backend if backend is None else backend
+    workers = _workers if workers is None else workers
+
+    if any(x.shape[a] % 2 for a in axes):
+        pre, post = (np.fft.fftshift, np.fft.ifftshift) if inverse else (np.fft.ifftshift, np.fft.fftshift)
+        y = _transform(pre(x, axes=axes), axes, inverse, norm, backend, workers)
+        return post(y, axes=axes)
+
+    c = _modulation(tuple(x.shape[a] for a in axes), axes, x.ndim, np.finfo(x.dtype).dtype)
+    y = _transform(x * c, axes, inverse, norm, backend, workers)
+    y *= c
+    if sum(x.shape[a] // 2 for a in axes) % 2:
+        y *= -1
+    return y
+
+
+def fftc(x, axes=(0, 1), norm=None, backend=None, workers=None):
+    """
+    Centered FFT, fftshift(fftn(ifftshift(x, axes), axes), axes).
+
+    Args:
+        x (np.ndarray): Input, not modified.
+        axes (int or tuple): Axes to transform.
+        norm (str): Normalization as in numpy.fft ('backward', 'ortho' or 'forward').
+        backend (str): 'scipy', 'numpy' or 'pyfftw', defaults to the one set with set_backend.
+        workers (int): Number of threads, defaults to the one set with set_backend.
+    """
+    return _centered(x, axes, False, norm, backend, workers)
+
+
+def ifftc(x, axes=(0, 1), norm=None, backend=None, workers=None):
+    """
+    Centered inverse FFT, ifftshift(ifftn(fftshift(x, axes), axes), axes). See fftc.
+    """
+    return _centered(x, axes, True, norm, backend, workers)
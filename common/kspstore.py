@@ -0,0 +1,198 @@
+# Chunked, compressed HDF5 store of k-space data.
+#
+# A CFL file has to be read (or at least paged in) in large parts even if only
+# one slice is needed, and complex64 noise-like data is stored uncompressed.
+# Here the k-space is stored in HDF5 in chunks of one slice and a group of
+# coils (axes 2 and 3, as in ksp_fully), optionally compressed losslessly
+# (byte shuffle + gzip or lzf). Reading a slice decompresses only its chunks.
+#
+# open_ksp() is the accessor for the figure scripts: it opens <name>.h5 if it
+# exists and maps <name>.cfl otherwise; both can be sliced like an array.
+# read_slice() reads one slice either way and closes the store again.
+# BART needs CFL files, so export_cfl() writes one from the store.
+#
+# Usage: python common/kspstore.py convert Data/ksp_fully [--coils-per-chunk 8] [--compression gzip]
+#        python common/kspstore.py export Data/ksp_fully.h5 out/ksp_fully
+
+import os
+import argparse
+
+import numpy as np
+
+from cflio import read_hdr, read_cfl, write_hdr, CflWriter
+
+
+SLICE_AXIS = 2
+COIL_AXIS = 3
+
+
+def _h5py():
+    # h5py is only needed for the store, CFL files work without it
+    import h5py
+    return h5py
+
+
+def chunk_shape(shape, coils_per_chunk=8):
+    """
+    One chunk per slice and group of coils_per_chunk coils, full in the other leading axes.
+    """
+    chunks = []
+    for axis, n in enumerate(shape):
+        if axis < SLICE_AXIS:
+            chunks.append(n)
+        elif axis == COIL_AXIS:
+            chunks.append(min(n, coils_per_chunk))
+        else:
+            chunks.append(1)
+    return tuple(chunks)
+
+
+def convert(cfl_name, h5_path=None, coils_per_chunk=8, compression='gzip', level=4):
+    """
+    Convert a CFL file into a chunked HDF5 store, chunk by chunk.
+
+    Args:
+        cfl_name (str): CFL file name without extension.
+        h5_path (str): Output file, defaults to cfl_name + '.h5'.
+        coils_per_chunk (int): Number of coils per chunk.
+        compression (str): 'gzip', 'lzf' or None.
+        level (int): gzip level (1-9).
+
+    Returns:
+        str: Path of the store.
+    """
+    h5py = _h5py()
+    h5_path = h5_path or cfl_name + '.h5'
+    src = read_cfl(cfl_name)
+    options = {}
+    if compression is not None:
+        options = dict(compression=compression, shuffle=True)
+        if compression == 'gzip':
+            options['compression_opts'] = level
+
+    with h5py.File(h5_path + '.tmp', 'w') as f:
+        dset = f.create_dataset('ksp', shape=src.shape, dtype=np.complex64,
+                                chunks=chunk_shape(src.shape, coils_per_chunk), **options)
+        dset.attrs['dims'] = read_hdr(cfl_name)
+        for sel in dset.iter_chunks():
+            dset[sel] = src[sel]
+    os.replace(h5_path + '.tmp', h5_path)
+    return h5_path
+
+
+class KspStore:
+    """
+    K-space in an HDF5 store, opened read-only.
+
+    Slicing reads only the chunks that are touched, e.g. store[:, :, 0, :] the chunks of slice 0.
+
+    Example:
+        with KspStore('Data/ksp_fully.h5') as store:
+            ksp = store.slice(0)
+    """
+
+    def __init__(self, path):
+        self.file = _h5py().File(path, 'r')
+        self.dset = self.file['ksp']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    @property
+    def shape(self):
+        return self.dset.shape
+
+    @property
+    def dtype(self):
+        return self.dset.dtype
+
+    @property
+    def ndim(self):
+        return self.dset.ndim
+
+    @property
+    def dims(self):
+        """
+        All dimensions of the original CFL header.
+        """
+        return [int(d) for d in self.dset.attrs['dims']]
+
+    def __getitem__(self, index):
+        return self.dset[index]
+
+    def slice(self, index, coils=slice(None)):
+        """
+        One slice (axis 2) with all or some coils, as array of shape (x, y, coils).
+        """
+        return self.dset[:, :, index, coils]
+
+
+def open_ksp(name):
+    """
+    K-space data name.h5 (KspStore) if it exists, else name.cfl (memory-mapped).
+
+    Both can be sliced like numpy arrays, slices are read lazily.
+    """
+    if os.path.exists(name + '.h5'):
+        return KspStore(name + '.h5')
+    return read_cfl(name)
+
+
+def read_slice(name, index, coils=slice(None)):
+    """
+    One slice of k-space data name.h5 or name.cfl, see open_ksp.
+
+    The store is closed again, for a CFL file the result is a view of the memory map.
+
+    Returns:
+        np.ndarray: Array of shape (x, y, coils).
+    """
+    if os.path.exists(name + '.h5'):
+        with KspStore(name + '.h5') as store:
+            return store.slice(index, coils)
+    return read_cfl(name)[:, :, index, coils]
+
+
+def export_cfl(h5_path, cfl_name, block_bytes=256 * 1024**2):
+    """
+    Write the content of a store as CFL file, block by block along the last axis.
+    """
+    with KspStore(h5_path) as store:
+        data = store.dset
+        step = max(1, block_bytes // (8 * int(np.prod(data.shape[:-1]))))
+        with CflWriter(cfl_name, data.shape) as w:
+            for i in range(0, data.shape[-1], step):
+                w.write(data[..., i:i + step])
+        # the store has no trailing singleton dimensions, the header keeps all of them
+        write_hdr(cfl_name, store.dims)
+    return cfl_name
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Chunked HDF5 store of k-space data.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    c = sub.add_parser('convert', help='convert a CFL file (name without extension) into name.h5')
+    c.add_argument('cfl')
+    c.add_argument('--output', help='output file (default: <cfl>.h5)')
+    c.add_argument('--coils-per-chunk', type=int, default=8)
+    c.add_argument('--compression', choices=['gzip', 'lzf', 'none'], default='gzip')
+    c.add_argument('--level', type=int, default=4, help='gzip level')
+    e = sub.add_parser('export', help='write a store as CFL file')
+    e.add_argument('h5')
+    e.add_argument('cfl', help='output name without extension')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        path = convert(args.cfl, args.output, args.coils_per_chunk,
+                       None if args.compression == 'none' else args.compression, args.level)
+        size = os.path.getsize(args.cfl + '.cfl')
+        print(f'{path}: {os.path.getsize(path) / 1024**2:.1f} MiB ({os.path.getsize(path) / size:.1%} of the CFL file)')
+    else:
+        export_cfl(args.h5, args.cfl)
+        print(f'Exported {args.cfl}.cfl')
@@ -0,0 +1,134 @@
+# Binary morphology with square structuring elements.
+#
+# scipy.ndimage.binary_erosion/dilation/closing test every element of the
+# structure at every pixel, so the cost grows with the kernel area (a 40x40
+# closing visits 1600 neighbours per pixel). A square is the product of two
+# lines, and erosion/dilation by a line is a running minimum/maximum, which
+# scipy computes in O(1) per pixel independent of the length. The functions
+# here give the same result as scipy with an all-ones structure of the same
+# size, including the shifted center of even sizes and border_value=0.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.ndimage import minimum_filter1d, maximum_filter1d
+
+
+def _box(mask, lo, hi, filter1d):
+    # filter1d over the window [x + lo, x + hi] along both axes, zero outside the image
+    size = hi - lo + 1
+    origin = -(size // 2) - lo
+    out = mask.view(np.uint8)
+    for axis in range(mask.ndim):
+        out = filter1d(out, size, axis=axis, mode='constant', cval=0, origin=origin)
+    return out.view(bool)
+
+
+def binary_erosion_box(mask, size):
+    """
+    Same as scipy.ndimage.binary_erosion(mask, structure=np.ones((size, size))).
+    """
+    mask = np.asarray(mask, dtype=bool)
+    return _box(mask, -(size // 2), size - 1 - size // 2, minimum_filter1d)
+
+
+def binary_dilation_box(mask, size, iterations=1):
+    """
+    Same as scipy.ndimage.binary_dilation(mask, structure=np.ones((size, size)), iterations=iterations).
+
+    The iterations are done at once as a dilation with a (iterations * (size - 1) + 1) square.
+    """
+    if iterations < 1:
+        raise ValueError('iterations must be at least 1')
+    mask = np.asarray(mask, dtype=bool)
+    return _box(mask, -iterations * (size - 1 - size // 2), iterations * (size // 2), maximum_filter1d)
+
+
+def binary_closing_box(mask, size):
+    """
+    Same as scipy.ndimage.binary_closing(mask, structure=np.ones((size, size))).
+    """
+    return binary_erosion_box(binary_dilation_box(mask, size), size)
+
+
+def _tight_mask(normalized_scan, threshold, hole_structure):
+    tight_mask = binary_closing_box(normalized_scan > threshold, hole_structure)
+    return binary_erosion_box(tight_mask, 10)
+
+
+def create_brain_masks(mri_scan, loose_padding=5, hole_structure=5, threshold=0.1):
+    """
+    Tight and loose brain masks of a magnitude image.
+
+    The tight mask is the image thresholded at threshold (10%) of its range,
+    with holes closed and shrunk by 10x10 erosion. The loose mask is the tight
+    mask dilated loose_padding times and eroded again.
+
+    Args:
+        mri_scan (np.ndarray): 2D magnitude image.
+        loose_padding (int): Number of dilations of the loose mask.
+        hole_structure (int): Size of the square used to close holes and to dilate.
+        threshold (float): Threshold relative to the range of the image.
+
+    Returns:
+        tight_mask (np.ndarray): uint8 mask.
+        loose_mask (np.ndarray): uint8 mask.
+    """
+    normalized_scan = (mri_scan - mri_scan.min()) / (mri_scan.max() - mri_scan.min())
+
+    tight_mask = _tight_mask(normalized_scan, threshold, hole_structure)
+
+    loose_mask = binary_dilation_box(tight_mask, hole_structure, iterations=loose_padding)
+    loose_mask = binary_erosion_box(loose_mask, 10)
+
+    return tight_mask.astype(np.uint8), loose_mask.astype(np.uint8)
+
+
+def _threshold_sweep(normalized_scan, threshold, paddings, hole_structure):
+    tight_mask = _tight_mask(normalized_scan, threshold, hole_structure)
+    masks = [tight_mask]
+    labels = [(threshold, 0)]
+
+    # padding k + 1 is one more dilation of padding k
+    dilated = tight_mask
+    done = 0
+    for padding in sorted(paddings):
+        if padding > done:
+            dilated = binary_dilation_box(dilated, hole_structure, iterations=padding - done)
+            done = padding
+        masks.append(binary_erosion_box(dilated, 10))
+        labels.append((threshold, padding))
+    return masks, labels
+
+
+def brain_mask_sweep(mri_scan, paddings, thresholds=(0.1,), hole_structure=5, workers=None):
+    """
+    Brain masks of create_brain_masks for many paddings and thresholds.
+
+    For every threshold the dilations are built incrementally, the mask for
+    padding k + 1 reuses the dilation of padding k. The thresholds are
+    processed in parallel in a thread pool.
+
+    Args:
+        mri_scan (np.ndarray): 2D magnitude image.
+        paddings (list of int): Numbers of dilations of the loose masks (>= 1).
+        thresholds (list of float): Thresholds relative to the range of the image.
+        hole_structure (int): Size of the square used to close holes and to dilate.
+        workers (int): Number of threads, defaults to one per threshold.
+
+    Returns:
+        masks (np.ndarray): Stack of uint8 masks, for every threshold first the
+            tight mask and then the loose masks in the order of sorted(paddings).
+        labels (list of tuple): (threshold, padding) of every mask, padding 0 is the tight mask.
+    """
+    normalized_scan = (mri_scan - mri_scan.min()) / (mri_scan.max() - mri_scan.min())
+    if min(paddings) < 1:
+        raise ValueError('paddings must be at least 1')
+
+    with ThreadPoolExecutor(workers or len(thresholds)) as pool:
+        results = list(pool.map(lambda t: _threshold_sweep(normalized_scan, t, paddings, hole_structure), thresholds))
+
+    masks = np.stack([m for r in results for m in r[0]]).astype(np.uint8)
+    labels = [l for r in results for l in r[1]]
+    return masks, labels
+
@@ -0,0 +1,72 @@
+# Grayscale image panels written directly as PNG.
+#
+# Rendering a matplotlib figure at high dpi only to show an array is slow and
+# memory hungry. Here an array is windowed, optionally sqrt-scaled, mapped to
+# 8 bit with the same quantization as imshow(..., cmap='gray'), upscaled by
+# pixel replication and written with Pillow. Several panels are written in
+# parallel; PNG compression releases the GIL.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+_GRAY_LUT = (np.linspace(0, 1, 256) * 255).astype(np.uint8)
+
+
+def to_uint8(image, vmin=None, vmax=None, scale='linear'):
+    """
+    Map an image to 8 bit gray values.
+
+    Args:
+        image (np.ndarray): 2D image, complex images are shown as magnitude.
+        vmin, vmax (float): Window (after scaling), defaults to the range of the image.
+        scale (str): 'linear' or 'sqrt'.
+
+    Returns:
+        np.ndarray: uint8 image, as imshow with the gray colormap would display it.
+    """
+    image = np.abs(image) if np.iscomplexobj(image) else np.asarray(image, dtype=np.float64)
+    if scale == 'sqrt':
+        image = np.sqrt(image)
+    elif scale != 'linear':
+        raise ValueError(f"Unknown scale '{scale}', expected 'linear' or 'sqrt'")
+
+    vmin = image.min() if vmin is None else vmin
+    vmax = image.max() if vmax is None else vmax
+    normalized = (image - vmin) / (vmax - vmin) if vmax > vmin else np.zeros_like(image)
+    # 256 entry lookup table of the gray colormap, truncated to 8 bit as by matplotlib
+    index = np.clip(np.floor(normalized * 256), 0, 255).astype(np.intp)
+    return _GRAY_LUT[index]
+
+
+def write_panel(path, image, vmin=None, vmax=None, scale='linear', upscale=1, size=None):
+    """
+    Write an image as grayscale PNG.
+
+    Args:
+        path (str): Output file.
+        image (np.ndarray): 2D image.
+        vmin, vmax, scale: Windowing, see to_uint8.
+        upscale (int): Integer upscaling by pixel replication.
+        size (tuple): Alternatively the (width, height) in pixels, nearest neighbour interpolation.
+    """
+    panel = Image.fromarray(to_uint8(image, vmin, vmax, scale))
+    if size is None:
+        size = (panel.width * upscale, panel.height * upscale)
+    if size != (panel.width, panel.height):
+        panel = panel.resize(size, Image.NEAREST)
+    panel.save(path)
+
+
+def write_panels(panels, workers=None):
+    """
+    Write several panels in parallel.
+
+    Args:
+        panels (list of dict): Keyword arguments of write_panel for every panel.
+        workers (int): Number of threads, defaults to one per panel.
+    """
+    with ThreadPoolExecutor(workers or max(1, len(panels))) as pool:
+        list(pool.map(lambda kwargs: write_panel(**kwargs), panels))
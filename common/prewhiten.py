@@ -0,0 +1,86 @@
+# Noise prewhitening in numpy, following 'bart whiten'.
+#
+# The noise covariance of the coils is estimated from noise samples and the
+# data is multiplied with the inverse of its Cholesky factor, which makes the
+# noise of the coils uncorrelated with equal variance. As in BART, the coils
+# are expected in dimension 3 (COIL_DIM) and all other dimensions are samples;
+# for data with fewer dimensions the covariance is a scalar. The covariance is
+# normalized by the size of dimension 0 of the noise minus one, and with
+# normalize=True ('bart whiten -n') the result is divided by the standard
+# deviation of the whitened noise, so the whitened noise has variance 1.
+
+import numpy as np
+
+
+COIL_DIM = 3
+
+
+def _samples_by_coils(x, coil_axis):
+    x = np.asarray(x)
+    if coil_axis >= x.ndim:
+        return x.reshape(-1, 1)
+    return np.moveaxis(x, coil_axis, -1).reshape(-1, x.shape[coil_axis])
+
+
+def noise_covariance(noise, coil_axis=COIL_DIM):
+    """
+    Coil noise covariance, sum over all samples of n n^H divided by noise.shape[0] - 1.
+    """
+    n = _samples_by_coils(noise, coil_axis)
+    return (n.T @ n.conj()) / (np.shape(noise)[0] - 1)
+
+
+def whitening_matrix(cov):
+    """
+    Inverse of the lower Cholesky factor L of cov = L L^H.
+    """
+    L = np.linalg.cholesky(cov)
+    return np.linalg.solve(L, np.eye(L.shape[0], dtype=L.dtype))
+
+
+def prewhiten(ksp, noise, coil_axis=COIL_DIM, normalize=True, out=None, block=1 << 20):
+    """
+    Prewhiten k-space data with the noise covariance of noise samples.
+
+    Args:
+        ksp (np.ndarray): Data to whiten.
+        noise (np.ndarray): Noise samples with the coils along the same axis.
+        coil_axis (int): Axis of the coils, dimension 3 as in BART.
+        normalize (bool): Scale to unit noise variance, as 'bart whiten -n'.
+        out (np.ndarray): Optional output, may be ksp itself to whiten in place.
+        block (int): Number of samples transformed at once.
+
+    Returns:
+        np.ndarray: Whitened data.
+    """
+    ksp = np.asarray(ksp)
+    W = whitening_matrix(noise_covariance(noise, coil_axis))
+
+    if normalize:
+        # standard deviation of all elements of the whitened noise, from its sums
+        n = _samples_by_coils(noise, coil_axis)
+        total = n.size
+        power = np.real(np.trace(W @ (n.T @ n.conj()) @ W.conj().T))
+        mean = (W @ n.mean(axis=0)).mean()
+        std = np.sqrt((power - total * np.abs(mean)**2) / (total - 1))
+        W = W / std
+
+    if out is None:
+        out = np.empty_like(ksp)
+    W = W.astype(out.dtype)
+
+    if coil_axis >= ksp.ndim:
+        np.multiply(ksp, W[0, 0], out=out)
+        return out
+
+    src = np.moveaxis(ksp, coil_axis, -1)
+    dst = np.moveaxis(out, coil_axis, -1)
+    flat_src = src.reshape(-1, src.shape[-1]) if src.flags.c_contiguous else None
+    if flat_src is not None and dst.flags.c_contiguous:
+        flat_dst = dst.reshape(-1, dst.shape[-1])
+        for i in range(0, flat_src.shape[0], block):
+            flat_dst[i:i + block] = flat_src[i:i + block] @ W.T
+    else:
+        for i in range(src.shape[0]):
+            dst[i] = src[i] @ W.T
+    return out
@@ -0,0 +1,136 @@
+# Sampling masks for retrospective undersampling.
+#
+# Masks are boolean arrays: 1-D over the phase encoding for Cartesian line
+# sampling, 2-D over both phase encodings for Poisson-disc sampling. Every
+# generator is deterministic for its arguments (random masks take a seed) and
+# memoized, so the same mask is built only once per process. The returned
+# arrays are shared and therefore read-only, use mask.copy() to modify one.
+
+from functools import lru_cache
+
+import numpy as np
+
+
+def _frozen(mask):
+    mask.setflags(write=False)
+    return mask
+
+
+def _center(n, count):
+    # slice of count central lines, as placed by equispaced_mask of Fig 7
+    start = (n // 2) - (count // 2)
+    return slice(start, start + count)
+
+
+@lru_cache(maxsize=256)
+def equispaced(n, factor, center_fraction=0.06):
+    """
+    Every factor-th line plus int(factor * center_fraction * n) lines in the center.
+
+    Returns:
+        np.ndarray: Read-only boolean mask of shape (n,).
+    """
+    mask = np.zeros(n, dtype=bool)
+    mask[::factor] = True
+    mask[_center(n, int(factor * center_fraction * n))] = True
+    return _frozen(mask)
+
+
+@lru_cache(maxsize=256)
+def variable_density(shape, factor, center_fraction=0.08, power=2.0, seed=0):
+    """
+    Random sampling with a density that decays with the distance from the k-space center.
+
+    A fully sampled center of center_fraction of every dimension is kept, the
+    remaining samples are drawn without replacement with a probability
+    proportional to (1 - r)**power, r being the normalized distance from the
+    center. In total round(size / factor) samples are taken.
+
+    Args:
+        shape (int or tuple): Mask shape, an int gives a 1-D line mask.
+        factor (float): Acceleration factor.
+        center_fraction (float): Fully sampled fraction of every dimension.
+        power (float): Decay of the sampling density.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        np.ndarray: Read-only boolean mask.
+    """
+    shape = (shape,) if np.isscalar(shape) else tuple(shape)
+    grids = np.meshgrid(*[np.linspace(-1, 1, n) for n in shape], indexing='ij')
+    r = np.sqrt(sum(g**2 for g in grids)) / np.sqrt(len(shape))
+
+    mask = np.zeros(shape, dtype=bool)
+    mask[tuple(_center(n, int(center_fraction * n)) for n in shape)] = True
+
+    total = int(round(mask.size / factor))
+    candidates = np.flatnonzero(~mask)
+    count = min(max(0, total - int(mask.sum())), candidates.size)
+    weights = (1 - r.ravel()[candidates])**power
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(candidates, size=count, replace=False, p=weights / weights.sum())
+    mask.ravel()[chosen] = True
+    return _frozen(mask)
+
+
+def _poisson_disc(shape, accel, radius, rng):
+    # greedy dart throwing over a random permutation of the grid, accepted
+    # samples block an ellipse (radius scaled with the acceleration per axis)
+    ry, rz = [radius * a for a in accel]
+    hy, hz = int(np.ceil(ry)), int(np.ceil(rz))
+    dy, dz = np.meshgrid(np.arange(-hy, hy + 1), np.arange(-hz, hz + 1), indexing='ij')
+    stencil = (dy / ry)**2 + (dz / rz)**2 < 1
+
+    blocked = np.zeros((shape[0] + 2 * hy, shape[1] + 2 * hz), dtype=bool)
+    mask = np.zeros(shape, dtype=bool)
+    for idx in rng.permutation(shape[0] * shape[1]):
+        y, z = divmod(int(idx), shape[1])
+        if blocked[y + hy, z + hz]:
+            continue
+        mask[y, z] = True
+        blocked[y:y + 2 * hy + 1, z:z + 2 * hz + 1] |= stencil
+    return mask
+
+
+@lru_cache(maxsize=64)
+def poisson_disc(shape, accel=(2, 1), calib=(0, 0), seed=0):
+    """
+    2-D Poisson-disc sampling, similar to 'bart poisson'.
+
+    Samples keep a minimum distance that scales with the acceleration of each
+    dimension. On the grid the number of samples changes in steps with the
+    distance, so the largest distance giving at least
+    round(size / (accel[0] * accel[1])) samples (including the fully sampled
+    calibration region) is searched by bisection, and the surplus samples are
+    dropped at random, which keeps the minimum distance.
+
+    Args:
+        shape (tuple): (ny, nz) of the mask.
+        accel (tuple): Acceleration factors in y and z.
+        calib (tuple): Size of the fully sampled center in y and z.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        np.ndarray: Read-only boolean mask of the given shape.
+    """
+    shape = tuple(shape)
+    center = tuple(_center(n, c) for n, c in zip(shape, calib))
+    calibration = np.zeros(shape, dtype=bool)
+    calibration[center] = True
+    target = int(round(shape[0] * shape[1] / (accel[0] * accel[1])))
+
+    rng = np.random.default_rng(seed)
+    mask = np.ones(shape, dtype=bool)
+    lo, hi = 0.0, 2.0 * max(shape)
+    for _ in range(30):
+        radius = (lo + hi) / 2
+        trial = _poisson_disc(shape, accel, radius, np.random.default_rng(seed)) | calibration
+        if trial.sum() >= target:
+            lo, mask = radius, trial
+        else:
+            hi = radius
+
+    surplus = np.flatnonzero(mask & ~calibration)
+    drop = min(max(0, int(mask.sum()) - target), surplus.size)
+    mask.ravel()[rng.choice(surplus, size=drop, replace=False)] = False
+    return _frozen(mask)
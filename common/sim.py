@@ -0,0 +1,123 @@
+# MRzero simulation with a preloaded phantom.
+#
+# mr0.util.simulate_2d loads and prepares the brain phantom on every call.
+# Here the phantom is converted to SimData once and reused for all sequences;
+# each simulation only computes the phase distribution graph and executes it.
+#
+# The pruning of the phase distribution graph (PDG) trades accuracy for speed
+# and is set with a PDGSettings record.
+
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import MRzeroCore as mr0
+
+
+@dataclass(frozen=True)
+class PDGSettings:
+    """
+    Pruning thresholds of the phase distribution graph simulation.
+
+    max_state_count and min_state_mag limit the graph (mr0.compute_graph),
+    min_emitted_signal and min_latent_signal skip weak states during its
+    execution (mr0.execute_graph). The defaults are the ones of simulate_2d.
+    """
+    max_state_count: int = 200
+    min_state_mag: float = 1e-5
+    min_emitted_signal: float = 0.01
+    min_latent_signal: float = 0.01
+
+
+PDG_PRESETS = {
+    # fast setting for interactive sweeps
+    'draft': PDGSettings(max_state_count=50, min_state_mag=1e-3, min_emitted_signal=0.05, min_latent_signal=0.05),
+    # settings of simulate_2d, used for the figures of the article
+    'publication': PDGSettings(),
+    # high accuracy reference for benchmarking the other settings
+    'reference': PDGSettings(max_state_count=5000, min_state_mag=1e-9, min_emitted_signal=1e-4, min_latent_signal=1e-4),
+}
+
+
+@contextmanager
+def stage(timings, name):
+    """
+    Add the wall-clock time of a 'with' block to timings[name].
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0) + time.perf_counter() - start
+
+
+def get_pdg_settings(pdg=None):
+    """
+    Resolve a preset name (see PDG_PRESETS) to PDGSettings, None gives 'publication'.
+    """
+    if pdg is None:
+        pdg = 'publication'
+    if isinstance(pdg, str):
+        if pdg not in PDG_PRESETS:
+            raise ValueError(f"Unknown PDG preset '{pdg}', expected one of {list(PDG_PRESETS)}")
+        pdg = PDG_PRESETS[pdg]
+    return pdg
+
+
+def load_sim_data(phantom_file, sim_size=None, timings=None):
+    """
+    Load a .mat phantom and prepare it for simulation as simulate_2d does.
+
+    Args:
+        phantom_file (str): .mat phantom, e.g. numerical_brain_cropped.mat.
+        sim_size (tuple): Optional (x, y) size the phantom is interpolated to.
+        timings (dict): Optional, receives the time of the 'phantom' stage.
+
+    Returns:
+        mr0.SimData: Phantom ready for simulation.
+    """
+    with stage(timings, 'phantom'):
+        obj_p = mr0.VoxelGridPhantom.load_mat(phantom_file)
+        if sim_size is not None:
+            obj_p = obj_p.interpolate(sim_size[0], sim_size[1], 1)
+        obj_p.D *= 0
+        return obj_p.build()
+
+
+def simulate(seq_file, sim_data, timings=None, pdg=None):
+    """
+    Simulate a sequence file with a preloaded phantom.
+
+    Args:
+        seq_file (str): Pulseq sequence file.
+        sim_data (mr0.SimData): Phantom from load_sim_data.
+        timings (dict): Optional, receives the times of the 'graph' and 'simulation' stages.
+        pdg (PDGSettings or str): Graph pruning settings or the name of a preset, defaults to 'publication'.
+
+    Returns:
+        torch.Tensor: Simulated signal.
+    """
+    pdg = get_pdg_settings(pdg)
+    with stage(timings, 'graph'):
+        seq0 = mr0.Sequence.import_file(seq_file)
+        graph = mr0.compute_graph(seq0, sim_data, pdg.max_state_count, pdg.min_state_mag)
+    with stage(timings, 'simulation'):
+        return mr0.execute_graph(graph, seq0, sim_data,
+                                 min_emitted_signal=pdg.min_emitted_signal,
+                                 min_latent_signal=pdg.min_latent_signal)
+
+
+def print_timings(timings, labels=None):
+    """
+    Print a table of per-stage times, one row per simulation and a total.
+    """
+    stages = ['phantom', 'graph', 'simulation']
+    if labels is None:
+        labels = [str(i) for i in range(len(timings))]
+    width = max([len(l) for l in labels] + [5])
+
+    print(' '.join([' ' * width] + [f'{s:>11}' for s in stages]) + '  [s]')
+    for label, t in zip(labels, timings):
+        print(' '.join([f'{label:>{width}}'] + [f'{t.get(s, 0):11.3f}' for s in stages]))
+    print(' '.join([f'{"total":>{width}}'] + [f'{sum(t.get(s, 0) for t in timings):11.3f}' for s in stages]))
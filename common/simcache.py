@@ -0,0 +1,142 @@
+# On-disk cache for simulated TSE signals.
+#
+# Entries are keyed by a hash of the written .seq file (all blocks and events),
+# the phantom file and the simulator settings, so an entry is only reused if
+# the simulation would produce the same signal. Each entry is a single .npz
+# file holding the signal and the sorted k-space. The cache is bounded in size
+# and evicts the least recently used entries first.
+
+import os
+import json
+import hashlib
+import tempfile
+
+import numpy as np
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.simcache')
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+_file_hashes = {}
+
+
+def file_hash(filename):
+    """
+    SHA-256 of a file, memoized by path, size and modification time.
+    """
+    st = os.stat(filename)
+    memo = (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+    if memo not in _file_hashes:
+        h = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        _file_hashes[memo] = h.hexdigest()
+    return _file_hashes[memo]
+
+
+def sequence_hash(seq_file):
+    """
+    SHA-256 of the block and event content of a .seq file. The trailing
+    [SIGNATURE] section is ignored.
+    """
+    with open(seq_file, 'rb') as f:
+        content = f.read()
+    content = content.split(b'\n[SIGNATURE]')[0]
+    return hashlib.sha256(content).hexdigest()
+
+
+def cache_key(seq_file, phantom_file, **settings):
+    """
+    Cache key of one simulation.
+
+    Args:
+        seq_file (str): Written pulseq sequence.
+        phantom_file (str): Phantom used for the simulation.
+        settings: Further simulator settings (JSON serializable), e.g. sim_size or noise_level.
+    """
+    h = hashlib.sha256()
+    h.update(sequence_hash(seq_file).encode())
+    h.update(file_hash(phantom_file).encode())
+    h.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class SimCache:
+    """
+    Size-bounded LRU cache of simulated signals in a directory.
+
+    Writers store to a temporary file and rename it into place, so concurrent
+    processes never see partially written entries.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        if directory is None:
+            directory = os.environ.get('MR0_SIM_CACHE', DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('MR0_SIM_CACHE_MB', DEFAULT_MAX_BYTES / 1024**2)) * 1024**2)
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        """
+        Returns (signal, kspace) as numpy arrays, or None if the key is not cached.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                signal, kspace = data['signal'], data['kspace']
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return signal, kspace
+
+    def put(self, key, signal, kspace):
+        """
+        Store the signal and k-space of a simulation and evict old entries.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, signal=np.asarray(signal), kspace=np.asarray(kspace))
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits into max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue  # removed by another process
+            entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(e[1] for e in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
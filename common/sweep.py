@@ -0,0 +1,212 @@
+# Parameter sweep over TSE variants.
+#
+# Every variant is a TSEParams record. The records are simulated with
+# MRzeroCore in a process pool and reconstructed together in one batched FFT,
+# the images come back in the order of the records. Simulated signals are kept in a SimCache, so unchanged
+# variants are not simulated again. Every worker prepares the phantom only
+# once and reuses it for all variants it simulates.
+
+import os
+import resource
+import tempfile
+import urllib.request
+import multiprocessing
+from importlib.metadata import version
+from functools import partial
+from dataclasses import asdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from tse import build_tse, phase_encoding_order, sort_kspace, reconstruct_batch
+from simcache import SimCache, cache_key
+from sim import load_sim_data, simulate, print_timings, get_pdg_settings
+
+
+# Same phantom as used by mr0.util.simulate_2d
+PHANTOM_URL = 'https://github.com/mzaiss/MRTwin_pulseq/raw/mr0-core/data/numerical_brain_cropped.mat'
+PHANTOM_FILE = os.path.basename(PHANTOM_URL)
+
+
+def ensure_phantom():
+    """
+    Download the brain phantom into the working directory, before the workers
+    are started, so they do not race for the download.
+    """
+    if not os.path.exists(PHANTOM_FILE):
+        print(f'Downloading {PHANTOM_URL}...')
+        urllib.request.urlretrieve(PHANTOM_URL, PHANTOM_FILE)
+
+
+# phantom of this process, loaded by the first variant that is not cached
+_sim_data = None
+
+
+def _init_worker(threads):
+    torch.set_num_threads(threads)
+
+
+def simulate_variant(p, cache=None, pdg=None):
+    """
+    Build and simulate one variant.
+
+    Args:
+        p (TSEParams): Variant to simulate.
+        cache (SimCache): Cache for the simulated signal, None disables caching.
+        pdg (PDGSettings or str): Graph pruning settings, see sim.PDG_PRESETS.
+
+    Returns:
+        signal (np.ndarray): Simulated signal (Nphase*Nread) in acquisition order.
+        timings (dict): Seconds spent in the 'phantom', 'graph' and 'simulation' stages.
+    """
+    global _sim_data
+    timings = {}
+    pdg = get_pdg_settings(pdg)
+
+    seq, phenc = build_tse(p)
+
+    # the sequence is written to a private file, the working directory is shared by all workers
+    with tempfile.TemporaryDirectory() as tmp:
+        seq_file = os.path.join(tmp, 'tse.seq')
+        seq.write(seq_file)
+
+        key = None
+        hit = None
+        if cache is not None:
+            key = cache_key(seq_file, PHANTOM_FILE, simulator='simulate', mr0=version('MRzeroCore'), **asdict(pdg))
+            hit = cache.get(key)
+
+        if hit is None:
+            if _sim_data is None:
+                _sim_data = load_sim_data(PHANTOM_FILE, timings=timings)
+            signal = simulate(seq_file, _sim_data, timings, pdg)
+            if cache is not None:
+                kspace = sort_kspace(signal, phenc, p.base_resolution, p.base_resolution)
+                cache.put(key, signal.numpy(), kspace.numpy())
+            signal = signal.numpy()
+        else:
+            signal = hit[0]
+
+    return signal, timings
+
+
+def run_sweep(params, workers=None, cache=True, pdg=None):
+    """
+    Simulate a list of variants in parallel.
+
+    Args:
+        params (list of TSEParams): Variants to simulate.
+        workers (int): Number of processes, defaults to one per CPU (MR0_CPUS, at most one per variant).
+        cache (bool or SimCache): Reuse previously simulated signals, True uses the default SimCache.
+        pdg (PDGSettings or str): Graph pruning settings, see sim.PDG_PRESETS.
+
+    Returns:
+        images (list of np.ndarray): Magnitude images in the order of params.
+        log_kspaces (list of np.ndarray): Log-magnitude k-spaces in the order of params.
+    """
+    params = list(params)
+    # CPU budget, e.g. set by run_all.py when other figures run at the same time
+    cpus = int(os.environ.get('MR0_CPUS', os.cpu_count() or 1))
+    if workers is None:
+        workers = min(len(params), cpus)
+    workers = max(1, workers)
+
+    if cache is True:
+        cache = SimCache()
+    elif cache is False:
+        cache = None
+    task = partial(simulate_variant, cache=cache, pdg=pdg)
+
+    ensure_phantom()
+
+    # Split the cores between the workers, torch would otherwise start one
+    # thread per core in every process.
+    threads = max(1, cpus // workers)
+
+    if workers == 1:
+        _init_worker(threads)
+        results = [task(p) for p in params]
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker, initargs=(threads,)) as pool:
+            results = list(pool.map(task, params))
+
+    print_timings([r[1] for r in results])
+
+    # reconstruct all variants of the same size together
+    images = [None] * len(params)
+    log_kspaces = [None] * len(params)
+    for res in sorted(set(p.base_resolution for p in params)):
+        idx = [i for i, p in enumerate(params) if p.base_resolution == res]
+        kspace = torch.from_numpy(np.stack([results[i][0] for i in idx])).reshape(len(idx), 1, res, res)
+        phenc = np.stack([phase_encoding_order(res, params[i].PEtype) for i in idx])
+        img, log_k = reconstruct_batch(kspace, phenc)
+        for j, i in enumerate(idx):
+            images[i] = img[j, 0]
+            log_kspaces[i] = log_k[j, 0]
+
+    return images, log_kspaces
+
+
+
+def _benchmark_task(p, pdg):
+    # runs in a fresh process, so ru_maxrss only covers this simulation
+    timings = {}
+    seq, phenc = build_tse(p)
+    sim_data = load_sim_data(PHANTOM_FILE)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory() as tmp:
+        seq_file = os.path.join(tmp, 'tse.seq')
+        seq.write(seq_file)
+        signal = simulate(seq_file, sim_data, timings, pdg)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before  # kB on Linux
+
+    kspace = signal.reshape(1, 1, p.base_resolution, p.base_resolution)
+    image, _ = reconstruct_batch(kspace, phenc[None])
+    return image[0, 0], timings['graph'] + timings['simulation'], peak * 1024
+
+
+def benchmark_pdg(params, settings=('draft', 'publication'), reference='reference', labels=None):
+    """
+    Compare graph pruning settings against a high accuracy reference.
+
+    Every variant is simulated with the reference and with each setting, one
+    simulation at a time and each in a fresh process. Reports the simulation
+    time, the additional peak memory of the simulation and the NRMSE of the
+    image relative to the reference image.
+
+    Args:
+        params (list of TSEParams): Variants to simulate.
+        settings (list of str or PDGSettings): Settings to compare.
+        reference (str or PDGSettings): Reference setting.
+        labels (list of str): Names of the variants for the report.
+
+    Returns:
+        list of dict: One row per variant and setting with the keys
+        'variant', 'setting', 'time', 'peak_memory' and 'nrmse'.
+    """
+    params = list(params)
+    if labels is None:
+        labels = [str(i) for i in range(len(params))]
+    settings = list(settings)
+    names = [s if isinstance(s, str) else repr(s) for s in settings]
+
+    ensure_phantom()
+
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(1, mp_context=ctx, max_tasks_per_child=1) as pool:
+        rows = []
+        for label, p in zip(labels, params):
+            ref_image, ref_time, ref_peak = pool.submit(_benchmark_task, p, get_pdg_settings(reference)).result()
+            rows.append(dict(variant=label, setting='reference', time=ref_time, peak_memory=ref_peak, nrmse=0.0))
+
+            for name, pdg in zip(names, settings):
+                image, t, peak = pool.submit(_benchmark_task, p, get_pdg_settings(pdg)).result()
+                nrmse = np.sqrt(np.mean((image - ref_image)**2)) / (ref_image.max() - ref_image.min())
+                rows.append(dict(variant=label, setting=name, time=t, peak_memory=peak, nrmse=nrmse))
+
+    print(f'{"variant":>8} {"setting":>12} {"time [s]":>10} {"peak [MB]":>10} {"NRMSE":>10}')
+    for r in rows:
+        print(f'{r["variant"]:>8} {r["setting"]:>12} {r["time"]:10.3f} {r["peak_memory"] / 1024**2:10.1f} {r["nrmse"]:10.2e}')
+    return rows
@@ -0,0 +1,253 @@
+# TSE sequence definition shared by the Fig 3 and Fig 4 scripts.
+#
+# We assume TE=10 ms, slice thickness of 50 mm. The parameters of a single
+# variant are collected in a TSEParams record, which mirrors the '@param'
+# sliders of the notebooks.
+
+from copy import copy
+from types import SimpleNamespace
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+import pypulseq as pp
+
+
+# Define FOV and resolution
+fov = 200e-3
+slice_thickness = 50e-3
+dwell = 50e-6*2
+
+
+@dataclass(frozen=True)
+class TSEParams:
+    """
+    Parameters of one TSE variant, named as the '@param' sliders of the notebooks.
+    """
+    base_resolution: int = 64
+    TE_ms: float = 10
+    TI_s: float = 0
+    Excitation_FA: float = 90
+    Excitation_phase: float = 90
+    ADC_phase: str = 'same as rfex'  # 'same as rfex' or 'alternating'
+    Refocusing_FA: float = 180
+    Refocusing_phase: float = 0
+    r_spoil: float = 1
+    PEtype: str = 'linear'  # 'centric' or 'linear'
+    PE_grad_on: bool = True
+    RO_grad_on: bool = True
+
+
+def make_system():
+    """
+    Returns the scanner limits used for all TSE sequences.
+    """
+    return pp.Opts(
+        max_grad=28, grad_unit='mT/m', max_slew=150, slew_unit='T/m/s',
+        rf_ringdown_time=20e-6, rf_dead_time=100e-6,
+        adc_dead_time=20e-6, grad_raster_time=10e-6)
+
+
+def phase_encoding_order(Nphase, PEtype):
+    """
+    Phase encoding k-space positions (1/m) in acquisition order.
+    """
+    if PEtype == 'centric':
+        return np.asarray([i // 2 if i % 2 == 0 else -(i + 1) // 2 for i in range(Nphase)]) / fov
+    else:
+        return np.arange(-Nphase // 2, Nphase // 2) / fov
+
+
+def make_trapezoids(channel, areas, duration, system):
+    """
+    Vectorized version of pp.make_trapezoid(channel=channel, area=area, duration=duration)
+    for a table of areas, e.g. all phase encoding gradients of a sequence.
+
+    Returns:
+        list of SimpleNamespace: One trapezoid event per area, equal to the pypulseq result.
+    """
+    areas = np.asarray(areas, dtype=float)
+
+    # let pypulseq check the limits for the largest gradient of the table
+    pp.make_trapezoid(channel=channel, area=areas[np.argmax(np.abs(areas))], duration=duration, system=system)
+
+    # shortest ramps for each area (calculate_shortest_params_for_area), then stretched to duration
+    raster = system.grad_raster_time
+    rise_time = np.ceil(np.sqrt(np.abs(areas) / system.max_slew) / raster) * raster
+    rise_time[rise_time < raster] = raster
+    amplitude = areas / rise_time
+    too_large = np.abs(amplitude) > system.max_grad
+    if too_large.any():
+        t_eff = np.ceil(np.abs(areas[too_large]) / system.max_grad / raster) * raster
+        rise_large = np.ceil(np.abs(areas[too_large] / t_eff) / system.max_slew / raster) * raster
+        rise_large[rise_large == 0] = raster
+        rise_time[too_large] = rise_large
+    fall_time = rise_time
+    flat_time = duration - rise_time - fall_time
+    amplitude = areas / (rise_time / 2 + fall_time / 2 + flat_time)
+
+    return [SimpleNamespace(type='trap', channel=channel, amplitude=float(a),
+                            rise_time=float(r), flat_time=float(f), fall_time=float(r),
+                            area=float(a * (f + r / 2 + r / 2)), flat_area=float(a * f),
+                            delay=0, first=0, last=0)
+            for a, r, f in zip(amplitude, rise_time, flat_time)]
+
+
+def build_tse(p, system=None):
+    """
+    Build the single shot TSE sequence of one variant.
+
+    Args:
+        p (TSEParams): Sequence parameters.
+        system (pp.Opts): Scanner limits, defaults to make_system().
+
+    Returns:
+        seq (pp.Sequence): The sequence.
+        phenc (np.ndarray): Phase encoding positions in acquisition order.
+    """
+    if system is None:
+        system = make_system()
+
+    seq = pp.Sequence(system)
+    TE = p.TE_ms*1e-3
+
+    Nread  = p.base_resolution  # frequency encoding steps/samples
+    Nphase = p.base_resolution  # phase encoding steps/samples
+
+    # Define rf events
+    rf1, gz1, gzr1 = pp.make_sinc_pulse(
+        flip_angle=p.Excitation_FA * np.pi / 180, phase_offset=p.Excitation_phase * np.pi / 180, duration=1e-3,
+        slice_thickness=slice_thickness, apodization=0.5, time_bw_product=4,
+        system=system, return_gz=True)
+
+    rf2, gz2, _ = pp.make_sinc_pulse(
+        flip_angle=p.Refocusing_FA* np.pi / 180, phase_offset=p.Refocusing_phase * np.pi / 180, duration=1e-3,
+        slice_thickness=slice_thickness, apodization=0.5, time_bw_product=4,
+        system=system, return_gz=True)
+
+    G_flag=(int(p.RO_grad_on),int(p.PE_grad_on))  # gradient flag (read,PE), if (0,0) all gradients are 0, for (1,0) PE is off
+
+    # Define other gradients and ADC events
+    gx = pp.make_trapezoid(channel='x', rise_time = 0.5*dwell, flat_area=Nread / fov*G_flag[0], flat_time=Nread*dwell, system=system)
+    adc = pp.make_adc(num_samples=Nread, duration=Nread*dwell, phase_offset=rf1.phase_offset, delay=0*gx.rise_time, system=system)
+    gx_pre0 = pp.make_trapezoid(channel='x', area=+((1.0 + p.r_spoil) * gx.area / 2) , duration=1.5e-3, system=system)
+    gx_prewinder = pp.make_trapezoid(channel='x', area=+(p.r_spoil * gx.area / 2), duration=1e-3, system=system)
+    gp = pp.make_trapezoid(channel='y', area=0 / fov, duration=1e-3, system=system)
+    rf_prep = pp.make_block_pulse(flip_angle=180 * np.pi / 180, duration=1e-3, system=system)
+
+    phenc = phase_encoding_order(Nphase, p.PEtype)
+
+    # the minimal TE is given by one full period form ref pulse to ref pulse, thus gz2+gx+2*gp
+    minTE2=(pp.calc_duration(gz2) +pp.calc_duration(gx) + 2*pp.calc_duration(gp))/2
+
+    minTE2=round(minTE2/10e-5)*10e-5
+
+    # to realize longer TE,  we introduce a TEdelay that is added before and afetr the encoding period
+    TEd=round(max(0, (TE/2-minTE2))/10e-5)*10e-5  # round to raster time
+
+    if TEd==0:
+        print('echo time set to minTE [ms]', 2*(minTE2 +TEd)*1000)
+    else:
+        print(' TE [ms]', 2*(minTE2 +TEd)*1000)
+
+    # FLAIR
+    if p.TI_s>0:
+        seq.add_block(rf_prep)
+        seq.add_block(gx_pre0)
+        seq.add_block(pp.make_delay(p.TI_s))
+
+    seq.add_block(rf1,gz1)
+    seq.add_block(gx_pre0,gzr1)
+
+    # last timing step is to add TE/2 also between excitation and first ref pulse
+    # from pulse top to pulse top we have already played out one full rf and gx_pre0, thus we substract these from TE/2
+    seq.add_block(pp.make_delay((minTE2 +TEd ) - pp.calc_duration(gz1)-pp.calc_duration(gx_pre0)))
+
+    # Events that are played out in every echo are created and registered in the
+    # event libraries only once; the blocks then just reference their ids.
+    # All phase encoding gradients are computed in one step from the area table.
+    areas = np.concatenate([phenc, -phenc]) * G_flag[1]
+    areas, table_ids = np.unique(areas, return_inverse=True)
+    gp_table = make_trapezoids('y', areas, 1e-3, system)
+    gp_ids = table_ids[:len(phenc)]   # +encoding
+    gp_ids_ = table_ids[len(phenc):]  # -encoding
+
+    TE_delay = pp.make_delay(TEd)
+    adc_alt = copy(adc)
+    adc_alt.phase_offset = adc.phase_offset + np.pi  # phase is only needed modulo 2 pi
+
+    rf2.id, rf2.shape_IDs = seq.register_rf_event(rf2)
+    for event in [gz2, gx_prewinder, gx, *gp_table]:
+        event.id = seq.register_grad_event(event)
+    adc.id = seq.register_adc_event(adc)
+    adc_alt.id = seq.register_adc_event(adc_alt)
+
+    for ii in range(len(phenc)):  # e.g. -64:63
+        gp  = gp_table[gp_ids[ii]]
+        gp_ = gp_table[gp_ids_[ii]]
+
+        seq.add_block(rf2,gz2)
+        seq.add_block(TE_delay) # TE delay
+        seq.add_block(gx_prewinder, gp)
+        if p.ADC_phase=='alternating' and ii % 2 == 0:
+            seq.add_block(adc_alt, gx)
+        else:
+            seq.add_block(adc, gx)
+        seq.add_block(gx_prewinder, gp_)
+        seq.add_block(TE_delay) # TE delay
+
+    # Check whether the timing of the sequence is correct
+    ok, error_report = seq.check_timing()
+    if ok:
+        print('Timing check passed successfully')
+    else:
+        print('Timing check failed. Error listing follows:')
+        [print(e) for e in error_report]
+
+    return seq, phenc
+
+
+def sort_kspace(signal, phenc, Nread, Nphase):
+    """
+    Reshape the simulated signal to k-space (Nread, Nphase) with sorted phase encoding lines.
+    """
+    kspace = torch.reshape((signal), (Nphase, Nread)).clone().t()
+    sort_ids = np.argsort(phenc) # sort phase encoding
+    return kspace[:,sort_ids]  # reorder kspace data
+
+
+def reconstruct_batch(kspace, phenc):
+    """
+    FFT reconstruction of a stack of TSE k-spaces in a single pass.
+
+    The phase encoding lines of all k-spaces are sorted with one gather and
+    all images are computed with one batched FFT. For even matrix sizes the
+    fftshift/ifftshift copies are replaced by an in-place checkerboard sign
+    modulation, which yields the same magnitude image.
+
+    Args:
+        kspace (torch.Tensor): Complex k-space (variants, coils, Nphase, Nread) in acquisition order.
+        phenc (np.ndarray): Phase encoding positions (variants, Nphase) in acquisition order.
+
+    Returns:
+        images (np.ndarray): Magnitude images (variants, coils, Nread, Nphase).
+        log_kspace (np.ndarray): Log-magnitude of the sorted k-spaces (variants, coils, Nread, Nphase).
+    """
+    V, C, Nphase, Nread = kspace.shape
+
+    # sort phase encoding
+    sort_ids = torch.from_numpy(np.argsort(np.asarray(phenc).reshape(V, Nphase), axis=-1))
+    sort_ids = sort_ids[:, None, :, None].expand(V, C, Nphase, Nread)
+    kspace = torch.gather(kspace, 2, sort_ids).transpose(-2, -1)  # (V, C, Nread, Nphase) view
+
+    log_kspace = torch.log(torch.abs(kspace)).numpy()
+
+    if Nread % 2 == 0 and Nphase % 2 == 0:
+        # |ifftshift(fft2(fftshift(k)))| = |fft2(k * (-1)^(x+y))| for even sizes
+        checker = 1 - 2 * ((torch.arange(Nread)[:, None] + torch.arange(Nphase)[None, :]) % 2)
+        space = torch.fft.fft2(kspace.mul_(checker))
+    else:
+        # fftshift,FFT,fftshift
+        space = torch.fft.ifftshift(torch.fft.fft2(torch.fft.fftshift(kspace, dim=(-2, -1))), dim=(-2, -1))
+
+    return torch.abs(space).numpy(), log_kspace
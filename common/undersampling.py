@@ -0,0 +1,55 @@
+# Retrospective undersampling of Cartesian k-space along the phase-encoding axis.
+#
+# A phase-encoding mask only depends on the phase-encoding index, so it is
+# kept as a 1-D array and broadcast over readout and coils instead of being
+# repeated to the full k-space size. The centered inverse FFT is separable:
+# the readout direction does not depend on the mask and is transformed once,
+# only the phase-encoding direction is transformed per mask. All masks are
+# processed together, coil block by coil block, and the root sum of squares
+# is accumulated, so memory stays bounded by one coil block per mask.
+
+import itertools
+
+import numpy as np
+
+from sampling import equispaced
+from fftc import ifftc
+
+
+def sweep_masks(width, factors, center_fractions=(0.06,)):
+    """
+    Equispaced masks for all combinations of acceleration factors and center fractions.
+
+    Returns:
+        masks (np.ndarray): Boolean masks of shape (len(factors) * len(center_fractions), width).
+        settings (list of tuple): (factor, center_fraction) of every mask.
+    """
+    settings = list(itertools.product(factors, center_fractions))
+    masks = np.stack([equispaced(width, f, c) for f, c in settings])
+    return masks, settings
+
+
+def undersampled_rss(ksp, masks, coil_block=8):
+    """
+    Root-sum-of-squares images of k-space undersampled with a batch of 1-D masks.
+
+    For every mask the result equals the RSS of ifft2c(ksp * mask[None, :, None])
+    over the coils, with ifft2c the centered inverse 2D FFT over axes 0 and 1.
+
+    Args:
+        ksp (np.ndarray): Fully sampled k-space of shape (readout, phase, coils).
+        masks (np.ndarray): Phase-encoding masks of shape (P, phase).
+        coil_block (int): Number of coils transformed at once.
+
+    Returns:
+        np.ndarray: RSS images of shape (P, readout, phase).
+    """
+    masks = np.asarray(masks)
+    rss = np.zeros((masks.shape[0],) + ksp.shape[:2], dtype=np.float64)
+
+    for c in range(0, ksp.shape[2], coil_block):
+        hybrid = ifftc(ksp[:, :, c:c + coil_block], axes=0)  # readout transformed once
+        img = ifftc(hybrid[None] * masks[:, None, :, None], axes=2)
+        rss += np.sum(np.abs(img)**2, axis=-1)
+
+    return np.sqrt(rss).astype(np.finfo(ksp.dtype).dtype, copy=False)
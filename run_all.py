@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# Reproduce all figures.
+#
+# Every figure is a job with declared inputs and outputs. A job is only run
+# if one of its inputs changed since its last successful run (or an output is
+# missing). Independent jobs run concurrently within a CPU budget: whenever
+# jobs can start, the free CPUs are split among the jobs still to run in
+# proportion to their weights (the share of jobs waiting for dependencies is
+# kept for them). A job uses its CPUs through the thread settings of the tools
+# (OMP_NUM_THREADS for BART, FIG6_THREADS, FFT_WORKERS, MR0_CPUS). The figures
+# are composed at the end in a single inkscape session (see common/compose.py).
+#
+# Usage: python3 run_all.py [job ...] [--cpus N] [--force]
+# Job output is written to .run_all/<job>.log.
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE_DIR = os.path.join(ROOT, '.run_all')
+
+sys.path.append(os.path.join(ROOT, 'common'))
+from compose import export_pending
+
+
+@dataclass
+class Job:
+    """
+    A step of the reproduction.
+
+    Args:
+        name: Name of the job.
+        cmd: Command, run in cwd (relative to the repository).
+        cwd: Working directory.
+        inputs: Files (relative to the repository) the outputs depend on.
+        outputs: Files the job creates.
+        deps: Jobs that have to finish before.
+        weight: Relative share of the CPU budget.
+    """
+    name: str
+    cmd: list
+    cwd: str
+    inputs: list
+    outputs: list
+    deps: list = field(default_factory=list)
+    weight: int = 1
+
+
+DATA = ['Data/ksp_fully.hdr', 'Data/ksp_fully.cfl']
+
+JOBS = [
+    Job('data', ['python3', 'fetch.py', '--strict'], 'Data', ['Data/fetch.py', 'Data/manifest.sha256'], DATA),
+    Job('fig3', ['python3', 'run.py'], 'Fig3_TSE_seq_def_pulseq',
+        ['Fig3_TSE_seq_def_pulseq/run.py', 'Fig3_TSE_seq_def_pulseq/Fig_3_template.svg',
+         'common/tse.py', 'common/compose.py'],
+        ['Fig3_TSE_seq_def_pulseq/Fig_3_TSE_Pulseq.pdf']),
+    Job('fig4', ['python3', 'run.py'], 'Fig4_TSE_2Dre-implementation',
+        ['Fig4_TSE_2Dre-implementation/run.py',
+         'common/tse.py', 'common/sweep.py', 'common/sim.py', 'common/simcache.py'],
+        ['Fig4_TSE_2Dre-implementation/Fig_4_TSE_2D_re-implementation.pdf'], weight=5),
+    Job('fig6', ['bash', 'run.sh'], 'Fig6_reproducible_recon',
+        ['Fig6_reproducible_recon/run.sh', 'Fig6_reproducible_recon/run.py', 'Fig6_reproducible_recon/Fig_6_template.svg',
+         'common/bartdag.py', 'common/cflio.py', 'common/kspstore.py', 'common/sampling.py', 'common/compose.py',
+         'Data/ksp_fully.h5'] + DATA,
+        ['Fig6_reproducible_recon/Fig_6_reproducible_recon.pdf'], deps=['data'], weight=8),
+    Job('fig7', ['python3', 'run.py'], 'Fig7_masking',
+        ['Fig7_masking/run.py', 'Fig7_masking/Fig_7_template.svg',
+         'common/bartmem.py', 'common/cflio.py', 'common/kspstore.py', 'common/masks.py', 'common/metrics.py',
+         'common/undersampling.py', 'common/sampling.py', 'common/fftc.py', 'common/coils.py', 'common/prewhiten.py',
+         'common/panels.py', 'common/compose.py', 'Data/ksp_fully.h5'] + DATA,
+        ['Fig7_masking/Fig_7_NRMSE_vs_mask.pdf'], deps=['data'], weight=4),
+]
+
+
+def _input_hash(job):
+    h = hashlib.sha256(json.dumps(job.cmd).encode())
+    for name in job.inputs:
+        path = os.path.join(ROOT, name)
+        h.update(b'\0' + name.encode())
+        if not os.path.exists(path):
+            h.update(b'missing')
+        elif os.path.getsize(path) > 64 * 1024**2:
+            # large data files are identified by size and modification time
+            st = os.stat(path)
+            h.update(f'{st.st_size} {st.st_mtime_ns}'.encode())
+        else:
+            with open(path, 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def _load_state():
+    path = os.path.join(STATE_DIR, 'state.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(state):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = os.path.join(STATE_DIR, 'state.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def _is_up_to_date(job, state):
+    if not all(os.path.exists(os.path.join(ROOT, o)) for o in job.outputs):
+        return False
+    return state.get(job.name) == _input_hash(job)
+
+
+def _run(job, cpus):
+    env = dict(os.environ, OMP_NUM_THREADS=str(cpus), FIG6_THREADS=str(cpus), FFT_WORKERS=str(cpus),
+               MR0_CPUS=str(cpus), COMPOSE_DEFER='1')
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(os.path.join(STATE_DIR, job.name + '.log'), 'w') as log:
+        subprocess.run(job.cmd, cwd=os.path.join(ROOT, job.cwd), env=env, stdout=log, stderr=subprocess.STDOUT,
+                       check=True)
+
+
+def _with_deps(names):
+    jobs = {j.name: j for j in JOBS}
+    selected = set()
+
+    def add(name):
+        if name not in jobs:
+            raise SystemExit(f"Unknown job '{name}', expected one of {list(jobs)}")
+        if name not in selected:
+            selected.add(name)
+            for d in jobs[name].deps:
+                add(d)
+
+    for n in names:
+        add(n)
+    return [j for j in JOBS if j.name in selected]
+
+
+def run(jobs, budget, force=False):
+    """
+    Run jobs (and their dependencies) concurrently within a budget of CPUs.
+
+    Returns:
+        dict: Per job (status, cpus, seconds), status is 'ran', 'up to date', 'failed' or 'skipped'.
+    """
+    state = _load_state()
+    report = {}
+    pending = list(jobs)
+    running = {}
+    free = budget
+
+    with ThreadPoolExecutor(len(jobs) or 1) as pool:
+        while pending or running:
+            ready = []
+            for job in list(pending):
+                if any(report.get(d, ('',))[0] in ('failed', 'skipped') for d in job.deps):
+                    pending.remove(job)
+                    report[job.name] = ('skipped', 0, 0.0)
+                    continue
+                if any(d in [j.name for j in pending] or d in [j.name for j, _, _ in running.values()]
+                       for d in job.deps):
+                    continue
+                if not force and _is_up_to_date(job, state):
+                    pending.remove(job)
+                    report[job.name] = ('up to date', 0, 0.0)
+                    continue
+                ready.append(job)
+
+            # shares of the free CPUs by weight, the last job to start gets the rest
+            weights = sum(j.weight for j in pending)
+            available = free
+            for job in ready:
+                if free == 0:
+                    break
+                if len(pending) == 1:
+                    cpus = free
+                else:
+                    cpus = min(free, max(1, round(available * job.weight / weights)))
+                pending.remove(job)
+                free -= cpus
+                print(f'[{job.name}] started with {cpus} CPU(s)', flush=True)
+                running[pool.submit(_run, job, cpus)] = (job, cpus, time.perf_counter())
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, cpus, start = running.pop(future)
+                free += cpus
+                seconds = time.perf_counter() - start
+                try:
+                    future.result()
+                except subprocess.CalledProcessError:
+                    report[job.name] = ('failed', cpus, seconds)
+                    log = os.path.relpath(os.path.join(STATE_DIR, job.name + '.log'))
+                    print(f'[{job.name}] failed after {seconds:.1f} s, see {log}', flush=True)
+                    continue
+                report[job.name] = ('ran', cpus, seconds)
+                state[job.name] = _input_hash(job)
+                _save_state(state)
+                print(f'[{job.name}] finished in {seconds:.1f} s', flush=True)
+
+    return {j.name: report[j.name] for j in jobs}
+
+
+def print_summary(report):
+    print(f'{"job":>8} {"status":>11} {"CPUs":>5} {"time [s]":>9}')
+    for name, (status, cpus, seconds) in report.items():
+        print(f'{name:>8} {status:>11} {cpus:>5} {seconds:9.1f}')
+    print(f'{"total":>8} {"":>11} {"":>5} {sum(r[2] for r in report.values()):9.1f}  (sum of job times)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reproduce the figures of the article.')
+    parser.add_argument('jobs', nargs='*', help=f'jobs to run (default: all of {[j.name for j in JOBS]})')
+    parser.add_argument('--cpus', type=int, default=os.cpu_count() or 1, help='CPU budget (default: all CPUs)')
+    parser.add_argument('--force', action='store_true', help='run the jobs even if they are up to date')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = run(_with_deps(args.jobs) if args.jobs else JOBS, max(1, args.cpus), args.force)
+
+    compose_start = time.perf_counter()
+    try:
+        exported = export_pending()
+        seconds = time.perf_counter() - compose_start
+        report['compose'] = ('ran', 1, seconds) if exported else ('up to date', 0, seconds)
+    except (subprocess.CalledProcessError, RuntimeError, FileNotFoundError) as e:
+        print(f'Composition failed: {e}')
+        report['compose'] = ('failed', 1, time.perf_counter() - compose_start)
+
+    print_summary(report)
+    print(f'Wall-clock time: {time.perf_counter() - start:.1f} s')
+    sys.exit(1 if any(r[0] in ('failed', 'skipped') for r in report.values()) else 0)
@@ -1,23 +1,5 @@
 #!/bin/bash
+# Reproduce all figures, see run_all.py (e.g. ./run_all.sh --cpus 8 fig6).
 
-bash Data/download.sh
-
-(
-    cd Fig3_TSE_seq_def_pulseq
-    python3 ./run.py
-)
-
-(
-    cd Fig4_TSE_2Dre-implementation
-    python3 ./run.py
-)
-
-(
-    cd Fig6_reproducible_recon
-    bash ./run.sh
-)
-
-(
-    cd Fig7_masking
-    python3 ./run.py
-)
+cd "$(dirname "$0")"
+exec python3 run_all.py "$@"
@@ -0,0 +1,9 @@
+# The shared modules are plain scripts in common/ and Data/, imported as the
+# figure scripts do by adding their directories to the path.
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'common'))
+sys.path.append(os.path.join(ROOT, 'Data'))
@@ -0,0 +1,173 @@
+# Data/fetch.py against a local HTTP server with range support.
+
+import io
+import os
+import re
+import json
+import hashlib
+import threading
+import http.server
+from functools import partial
+
+import pytest
+
+import fetch
+
+CHUNK = 1 << 16
+
+
+class RangeHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Static files with single byte-range requests, every request is logged in server.requests.
+    """
+
+    def send_head(self):
+        self.server.requests.append((self.path, self.headers.get('Range')))
+        match = re.fullmatch(r'bytes=(\d+)-(\d+)', self.headers.get('Range') or '')
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start, stop = int(match[1]), min(int(match[2]), size - 1)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(stop - start + 1)
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{stop}/{size}')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        return io.BytesIO(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    served = tmp_path / 'served'
+    served.mkdir()
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), partial(RangeHandler, directory=str(served)))
+    httpd.requests = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd, served, f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _publish(served, name, size=5 * CHUNK + 123):
+    data = os.urandom(size)
+    (served / name).write_bytes(data)
+    return data
+
+
+def _manifest(data_dir, entries):
+    (data_dir / 'manifest.sha256').write_text(''.join(f'{d}  {n}\n' for n, d in entries.items()))
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    d = tmp_path / 'data'
+    d.mkdir()
+    return d
+
+
+def test_resume_after_failed_chunk(server, data_dir, monkeypatch):
+    httpd, served, url = server
+    data = _publish(served, 'ksp.cfl')
+    _manifest(data_dir, {'ksp.cfl': hashlib.sha256(data).hexdigest()})
+
+    copy = fetch._copy
+
+    def failing_copy(response, f):
+        if f.tell() == 2 * CHUNK:
+            raise IOError('connection reset')
+        copy(response, f)
+
+    monkeypatch.setattr(fetch, '_copy', failing_copy)
+    with pytest.raises(IOError):
+        fetch.fetch('ksp.cfl', url, workers=1, chunk=CHUNK, data_dir=str(data_dir))
+    assert not (data_dir / 'ksp.cfl').exists()
+    done = json.loads((data_dir / 'ksp.cfl.part.json').read_text())['done']
+    assert done[:2] == [0, 1] and 2 not in done
+
+    monkeypatch.setattr(fetch, '_copy', copy)
+    httpd.requests.clear()
+    fetch.fetch('ksp.cfl', url, workers=2, chunk=CHUNK, data_dir=str(data_dir))
+    assert (data_dir / 'ksp.cfl').read_bytes() == data
+    # the probe and only the chunks that were missing
+    missing = [f'bytes={i * CHUNK}-{min(len(data), (i + 1) * CHUNK) - 1}' for i in range(6) if i not in done]
+    assert sorted(r for _, r in httpd.requests) == sorted(['bytes=0-0'] + missing)
+    assert not (data_dir / 'ksp.cfl.part').exists()
+    assert not (data_dir / 'ksp.cfl.part.json').exists()
+
+
+def test_checksum_mismatch(server, data_dir):
+    _, served, url = server
+    _publish(served, 'ksp.cfl')
+    _manifest(data_dir, {'ksp.cfl': '0' * 64})
+
+    with pytest.raises(IOError, match='checksum mismatch'):
+        fetch.fetch('ksp.cfl', url, chunk=CHUNK, data_dir=str(data_dir))
+    assert not (data_dir / 'ksp.cfl').exists()
+    assert not (data_dir / 'ksp.cfl.part').exists()
+
+
+def test_skip_if_verified(server, data_dir):
+    httpd, served, url = server
+    data = _publish(served, 'ksp.cfl')
+    _manifest(data_dir, {'ksp.cfl': hashlib.sha256(data).hexdigest()})
+
+    fetch.fetch('ksp.cfl', url, chunk=CHUNK, data_dir=str(data_dir))
+    httpd.requests.clear()
+    fetch.fetch('ksp.cfl', url, chunk=CHUNK, data_dir=str(data_dir))
+    assert httpd.requests == []
+
+    # a modified file is checked again and downloaded anew
+    with open(data_dir / 'ksp.cfl', 'r+b') as f:
+        f.write(b'x')
+    fetch.fetch('ksp.cfl', url, chunk=CHUNK, data_dir=str(data_dir))
+    assert httpd.requests
+    assert (data_dir / 'ksp.cfl').read_bytes() == data
+
+
+def test_without_manifest_entry(server, data_dir):
+    _, served, url = server
+    data = _publish(served, 'ksp.hdr', 30)
+    _manifest(data_dir, {})
+
+    with pytest.raises(IOError, match='neither a manifest entry nor a published checksum'):
+        fetch.fetch('ksp.hdr', url, data_dir=str(data_dir), strict=True, record=None)
+    assert not (data_dir / 'ksp.hdr').exists()
+
+    fetch.fetch('ksp.hdr', url, data_dir=str(data_dir), record=None)
+    assert (data_dir / 'ksp.hdr').read_bytes() == data
+    assert (data_dir / 'manifest.sha256').read_text() == ''
+    assert fetch.verified_hash(str(data_dir / 'ksp.hdr')) == hashlib.sha256(data).hexdigest()
+
+
+def _record(served, entries):
+    # metadata of a Zenodo record, as served by its API
+    files = [dict(key=n, size=len(d), checksum='md5:' + hashlib.md5(d).hexdigest()) for n, d in entries.items()]
+    (served / 'record').write_text(json.dumps(dict(id=1, files=files)))
+
+
+def test_published_checksum(server, data_dir):
+    httpd, served, url = server
+    data = _publish(served, 'ksp.cfl')
+    _manifest(data_dir, {})
+    _record(served, {'ksp.cfl': data})
+
+    fetch.fetch('ksp.cfl', url, chunk=CHUNK, data_dir=str(data_dir), strict=True, record=url + '/record')
+    assert (data_dir / 'ksp.cfl').read_bytes() == data
+
+    # verified files are skipped without asking for the record again
+    httpd.requests.clear()
+    fetch.fetch('ksp.cfl', url, chunk=CHUNK, data_dir=str(data_dir), strict=True, record=url + '/record2')
+    assert httpd.requests == []
+
+    _record(served, {'ksp.cfl': b'other'})
+    fetch.published_checksums.cache_clear()
+    (data_dir / 'ksp.cfl').unlink()
+    with pytest.raises(IOError, match='checksum mismatch, expected md5:'):
+        fetch.fetch('ksp.cfl', url, chunk=CHUNK, data_dir=str(data_dir), record=url + '/record')
+    assert not (data_dir / 'ksp.cfl').exists()
@@ -0,0 +1,77 @@
+# common/masks.py against scipy.ndimage with all-ones structures.
+
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from masks import (binary_erosion_box, binary_dilation_box, binary_closing_box, create_brain_masks,
+                   brain_mask_sweep)
+
+
+def _random_mask(density, shape=(97, 64), seed=0):
+    return np.random.default_rng(seed).random(shape) < density
+
+
+def _edge_mask(shape=(97, 64)):
+    # blobs touching every border and a corner, where the zero border of scipy matters
+    mask = np.zeros(shape, dtype=bool)
+    mask[:20, :] = True
+    mask[:, -7:] = True
+    mask[-3:, :5] = True
+    mask[40:60, 20:30] = True
+    mask[50, 25] = False
+    return mask
+
+
+MASKS = [_random_mask(0.05), _random_mask(0.5), _random_mask(0.95), _edge_mask()]
+IDS = ['sparse', 'half', 'dense', 'edges']
+
+
+@pytest.mark.parametrize('mask', MASKS, ids=IDS)
+@pytest.mark.parametrize('size', [1, 2, 3, 4, 10, 11, 40])
+def test_erosion(mask, size):
+    expected = ndimage.binary_erosion(mask, np.ones((size, size)))
+    assert np.array_equal(binary_erosion_box(mask, size), expected)
+
+
+@pytest.mark.parametrize('mask', MASKS, ids=IDS)
+@pytest.mark.parametrize('size', [2, 5, 10, 40])
+@pytest.mark.parametrize('iterations', [1, 2, 5])
+def test_dilation(mask, size, iterations):
+    expected = ndimage.binary_dilation(mask, np.ones((size, size)), iterations=iterations)
+    assert np.array_equal(binary_dilation_box(mask, size, iterations), expected)
+
+
+@pytest.mark.parametrize('mask', MASKS, ids=IDS)
+@pytest.mark.parametrize('size', [3, 5, 10, 40])
+def test_closing(mask, size):
+    expected = ndimage.binary_closing(mask, np.ones((size, size)))
+    assert np.array_equal(binary_closing_box(mask, size), expected)
+
+
+def _scipy_brain_masks(mri_scan, loose_padding, hole_structure, threshold=0.1):
+    # the scipy version of create_brain_masks used by Fig 7 before
+    normalized_scan = (mri_scan - mri_scan.min()) / (mri_scan.max() - mri_scan.min())
+    structure = np.ones((hole_structure, hole_structure))
+    tight_mask = ndimage.binary_closing(normalized_scan > threshold, structure)
+    tight_mask = ndimage.binary_erosion(tight_mask, np.ones((10, 10)))
+    loose_mask = ndimage.binary_dilation(tight_mask, structure, iterations=loose_padding)
+    loose_mask = ndimage.binary_erosion(loose_mask, np.ones((10, 10)))
+    return tight_mask.astype(np.uint8), loose_mask.astype(np.uint8)
+
+
+@pytest.mark.parametrize('hole_structure', [5, 40])
+def test_brain_masks(hole_structure):
+    image = ndimage.gaussian_filter(np.random.default_rng(1).random((160, 120)), 5)
+    for result, expected in zip(create_brain_masks(image, 5, hole_structure),
+                                _scipy_brain_masks(image, 5, hole_structure)):
+        assert np.array_equal(result, expected)
+
+
+def test_sweep_matches_single_masks():
+    image = ndimage.gaussian_filter(np.random.default_rng(0).random((120, 100)), 5)
+    stack, labels = brain_mask_sweep(image, [1, 2, 4], thresholds=[0.2, 0.5], hole_structure=7)
+    assert len(stack) == len(labels) == 8
+    for mask, (threshold, padding) in zip(stack, labels):
+        tight, loose = create_brain_masks(image, max(padding, 1), 7, threshold)
+        assert np.array_equal(mask, loose if padding else tight)
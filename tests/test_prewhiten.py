@@ -0,0 +1,64 @@
+# common/prewhiten.py, against 'bart whiten -n' if BART is installed.
+
+import shutil
+
+import numpy as np
+import pytest
+
+from prewhiten import prewhiten, noise_covariance
+from bartmem import BartSession, _bart_binary
+
+# relative deviation from BART allowed for complex64 data
+TOLERANCE = 1e-4
+
+needs_bart = pytest.mark.skipif(shutil.which(_bart_binary()) is None, reason='bart not found')
+
+
+def _complex_normal(rng, shape):
+    return (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(np.complex64)
+
+
+def _coil_data(coils=8, seed=0):
+    # k-space (x, y, 1, coils) and noise (samples, 1, 1, coils) with correlated coil noise, coils in dimension 3
+    rng = np.random.default_rng(seed)
+    mixing = np.eye(coils) + 0.3 * _complex_normal(rng, (coils, coils))
+    ksp = (_complex_normal(rng, (64, 48, 1, coils)) @ mixing).astype(np.complex64)
+    noise = (0.1 * _complex_normal(rng, (2000, 1, 1, coils)) @ mixing).astype(np.complex64)
+    return ksp, noise
+
+
+def _relative_error(a, b):
+    return np.abs(np.asarray(a) - np.asarray(b)).max() / np.abs(b).max()
+
+
+def test_whitened_noise_has_unit_covariance():
+    _, noise = _coil_data()
+    white = prewhiten(noise, noise)
+    np.testing.assert_allclose(noise_covariance(white), np.eye(noise.shape[-1]), atol=1e-3)
+
+
+def test_without_coil_dimension_is_scaling():
+    # coils in dimension 2 as in Fig 7: every element is a sample of one channel
+    ksp, noise = _coil_data()
+    ksp, noise = ksp[:, :, 0, :], noise[:, :, 0, :]
+    white = prewhiten(ksp, noise)
+    np.testing.assert_allclose(white, ksp / np.std(noise, ddof=1), rtol=1e-4)
+
+
+@needs_bart
+def test_matches_bart_with_coils():
+    ksp, noise = _coil_data()
+    with BartSession() as bart:
+        expected = np.array(bart('whiten -n', ksp, noise))
+    assert _relative_error(prewhiten(ksp, noise), expected) < TOLERANCE
+
+
+@needs_bart
+def test_matches_bart_fig7_layout():
+    # noise from 'fft -i -u 1' and 'transpose 1 0' as in Fig 7, coils in dimension 2
+    ksp, _ = _coil_data()
+    ksp = ksp[:, :, 0, :]
+    with BartSession() as bart:
+        noise = bart('transpose 1 0', bart('fft -i -u 1', ksp))
+        expected = np.array(bart('whiten -n', ksp, noise))
+    assert _relative_error(prewhiten(ksp, np.array(noise)), expected) < TOLERANCE